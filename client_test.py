@@ -1,24 +1,72 @@
 import asyncio
-import json
+import os
 import uuid
 import httpx
-
-MCP_URL = "http://0.0.0.0:8000/mcp"
+import orjson
+
+try:  # uvloop есть только на Linux/macOS
+    import uvloop
+except ImportError:
+    uvloop = None
+
+MCP_BASE_URL = "http://0.0.0.0:8000"
+MCP_PATH = "/mcp"
+
+# Полный вывод (сырой SSE + красиво отформатированный JSON) — только по запросу
+VERBOSE = os.getenv("MCP_TEST_VERBOSE") == "1"
+
+
+def make_client() -> httpx.AsyncClient:
+    """
+    Клиент для MCP-сервера: один на все вызовы, чтобы соединение
+    переиспользовалось (keep-alive), а заголовки не собирались заново.
+    """
+    return httpx.AsyncClient(
+        base_url=MCP_BASE_URL,
+        timeout=120.0,
+        headers={
+            "Content-Type": "application/json",
+            "Accept": "application/json, text/event-stream",
+        },
+    )
 
 
-def extract_sse_json(raw: str):
+def extract_sse_json(raw: bytes):
     """Вытаскиваем последнее data:{...} из SSE-ответа."""
-    last_json = None
-    for line in raw.splitlines():
-        line = line.strip()
-        if line.startswith("data:"):
-            candidate = line.removeprefix("data:").strip()
+    # Идём с конца буфера через bytes.rfind (memchr), без разбиения на строки.
+    # Payload возвращается как bytes — orjson разбирает их без декодирования.
+    end = len(raw)
+    while end > 0:
+        i = raw.rfind(b"data:", 0, end)
+        if i == -1:
+            return None
+        # "data:" должно стоять в начале строки
+        if i == 0 or raw[i - 1] in b"\r\n":
+            start = i + len(b"data:")
+            stop = raw.find(b"\n", start)
+            if stop == -1:
+                stop = len(raw)
+            candidate = bytes(raw[start:stop]).strip()
             if candidate:
-                last_json = candidate
-    return last_json
+                return candidate
+        end = i
+    return None
+
 
+def _events_end(buf: bytearray) -> int:
+    """Позиция сразу после последнего завершённого SSE-события (0 — таких нет)."""
+    lf = buf.rfind(b"\n\n")
+    crlf = buf.rfind(b"\r\n\r\n")
+    return max(lf + 2 if lf != -1 else 0, crlf + 4 if crlf != -1 else 0)
 
-async def call_tool(name: str, arguments: dict):
+
+def _process_events(events: bytes):
+    if VERBOSE:
+        print(bytes(events).decode("utf-8", errors="replace"), end="")
+    return extract_sse_json(events)
+
+
+async def call_tool(client: httpx.AsyncClient, name: str, arguments: dict):
     request_id = str(uuid.uuid4())
 
     payload = {
@@ -31,28 +79,39 @@ async def call_tool(name: str, arguments: dict):
         },
     }
 
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json, text/event-stream",
-    }
+    if VERBOSE:
+        print("\n=== RAW SSE ===")
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        resp = await client.post(MCP_URL, headers=headers, json=payload)
+    # Разбираем поток по мере поступления: в буфере держим только
+    # недополученное событие, из завершённых событий берём последний data:
+    json_text = None
+    buf = bytearray()
+    async with client.stream("POST", MCP_PATH, json=payload) as resp:
         resp.raise_for_status()
-        raw = resp.text
+        async for chunk in resp.aiter_bytes():
+            buf += chunk
+            end = _events_end(buf)
+            if end:
+                json_text = _process_events(buf[:end]) or json_text
+                del buf[:end]
+    if buf:
+        json_text = _process_events(buf) or json_text
 
-    print("\n=== RAW SSE ===")
-    print(raw)
-
-    json_text = extract_sse_json(raw)
     if not json_text:
         print("❌ JSON не найден в SSE потоке")
         return
 
-    data = json.loads(json_text)
+    data = orjson.loads(json_text)
 
-    print("\n=== PARSED JSON ===")
-    print(json.dumps(data, indent=2, ensure_ascii=False))
+    if VERBOSE:
+        print("\n=== PARSED JSON ===")
+        pretty = orjson.dumps(
+            data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        )
+        print(pretty.decode())
+    else:
+        failed = "error" in data or (data.get("result") or {}).get("isError")
+        print(f"{'❌' if failed else '✅'} {name}")
 
     return data
 
@@ -60,46 +119,55 @@ async def call_tool(name: str, arguments: dict):
 # --- Тестовые вызовы инструмента ---
 
 
-async def test_all():
-    print("\n>>> get_new_tickets")
-    await call_tool("get_new_tickets", {"since_minutes": 60})
-
-    print("\n>>> get_ticket_detail")
-    await call_tool("get_ticket_detail", {"issue_number": 3})
+# Инструменты, которые только читают GitHub/доки, — их можно гонять параллельно
+READ_ONLY_CALLS = [
+    ("get_new_tickets", {"since_minutes": 60}),
+    ("get_ticket_detail", {"issue_number": 3}),
+    ("get_tickets_details", {"issue_numbers": [1, 3]}),
+    ("search_docs", {"query": "ошибка", "max_results": 3}),
+    (
+        "create_subtasks_from_ticket",
+        {"issue_number": 3, "dry_run": True, "max_subtasks": 3},
+    ),
+    ("generate_support_report", {"period_days": 7}),
+    ("summarize_ticket", {"issue_number": 3}),
+]
 
-    print("\n>>> classify_ticket")
-    await call_tool("classify_ticket", {"issue_number": 3})
+# Инструменты, которые меняют тикет (метки, приоритет, комментарии), —
+# строго по очереди и после параллельного блока
+WRITE_CALLS = [
+    ("classify_ticket", {"issue_number": 3}),
+    ("request_more_info", {"issue_number": 3}),
+    ("analyze_ticket_error", {"issue_number": 3}),
+    ("translate_ticket", {"issue_number": 3, "target_lang": "en"}),
+    ("answer_ticket_question", {"issue_number": 3}),
+]
 
-    print("\n>>> request_more_info")
-    await call_tool("request_more_info", {"issue_number": 3})
+MAX_CONCURRENCY = 4
 
-    print("\n>>> analyze_ticket_error")
-    await call_tool("analyze_ticket_error", {"issue_number": 3})
 
-    print("\n>>> search_docs")
-    await call_tool("search_docs", {"query": "ошибка", "max_results": 3})
+async def test_all(client: httpx.AsyncClient):
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
 
-    print("\n>>> create_subtasks_from_ticket (dry_run)")
-    await call_tool(
-        "create_subtasks_from_ticket",
-        {"issue_number": 3, "dry_run": True, "max_subtasks": 3},
-    )
+    async def run(name: str, arguments: dict):
+        async with sem:
+            print(f"\n>>> {name}")
+            return await call_tool(client, name, arguments)
 
-    print("\n>>> translate_ticket")
-    await call_tool(
-        "translate_ticket",
-        {"issue_number": 3, "target_lang": "en"}
-    )
+    await asyncio.gather(*(run(name, args) for name, args in READ_ONLY_CALLS))
 
-    print("\n>>> generate_support_report")
-    await call_tool("generate_support_report", {"period_days": 7})
+    for name, args in WRITE_CALLS:
+        print(f"\n>>> {name}")
+        await call_tool(client, name, args)
 
-    print("\n>>> summarize_ticket")
-    await call_tool("summarize_ticket", {"issue_number": 3})
 
-    print("\n>>> answer_ticket_question")
-    await call_tool("answer_ticket_question", {"issue_number": 3})
+async def main():
+    async with make_client() as client:
+        await test_all(client)
 
 
 if __name__ == "__main__":
-    asyncio.run(test_all())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -1,5 +1,7 @@
 # server.py
 import os
+
+import anyio
 from dotenv import load_dotenv, find_dotenv
 from opentelemetry import trace
 
@@ -9,6 +11,7 @@ from mcp_instance import mcp
 
 from tools.get_new_tickets import get_new_tickets  # noqa: F401
 from tools.get_ticket_detail import get_ticket_detail  # noqa: F401
+from tools.get_tickets_details import get_tickets_details  # noqa: F401
 from tools.post_ticket_reply import post_ticket_reply  # noqa: F401
 from tools.get_ticket_last_comment import get_ticket_last_comment # noqa: F401
 from tools.update_ticket_meta import update_ticket_meta # noqa: F401
@@ -23,6 +26,12 @@ from tools.generate_support_report import generate_support_report  # noqa: F401
 from tools.answer_ticket_question import answer_ticket_question  # noqa: F401
 from tools.summarize_ticket import summarize_ticket  # noqa: F401
 from tools.close_ticket import close_ticket  # noqa: F401
+from tools._http import close_client
+
+try:  # uvloop есть только на Linux/macOS — на Windows работаем на обычном asyncio
+    import uvloop  # noqa: F401
+except ImportError:
+    uvloop = None
 
 
 PORT = int(os.getenv("PORT", "8080"))
@@ -31,8 +40,38 @@ tracer = trace.get_tracer(__name__)
 
 
 def init_tracing() -> None:
-    # пока заглушка
-    pass
+    """
+    Экспорт span'ов по OTLP, если задан OTEL_EXPORTER_OTLP_ENDPOINT и
+    установлены opentelemetry-sdk и opentelemetry-exporter-otlp-proto-http.
+
+    Репозиторий — атрибут Resource, общий для всех span'ов процесса, а не
+    атрибут каждого span'а. BatchSpanProcessor отправляет span'ы фоном
+    и не задерживает ответ инструмента.
+    """
+    # без экспорта остаётся NoOp-провайдер, и tool_span не создаёт span'ов вовсе
+    if os.getenv("OTEL_SDK_DISABLED", "").lower() == "true" or not os.getenv(
+        "OTEL_EXPORTER_OTLP_ENDPOINT"
+    ):
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        return
+
+    resource = Resource.create(
+        {
+            "service.name": "support-mcp",
+            "github.repo": os.getenv("GITHUB_REPO", ""),
+        }
+    )
+    provider = TracerProvider(resource=resource)
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
 
 
 init_tracing()
@@ -43,6 +82,14 @@ def support_prompt(query: str = "") -> str:
     return f"Ты — AI-помощник службы поддержки. Обработай запрос: {query}"
 
 
+async def serve() -> None:
+    """Запускает streamable-http транспорт и закрывает общий GitHub-клиент на выходе."""
+    try:
+        await mcp.run_streamable_http_async()
+    finally:
+        await close_client()
+
+
 def main() -> None:
     print("=" * 60)
     print("🌐 ЗАПУСК MCP СЕРВЕРА ДЛЯ ТИКЕТОВ ПОДДЕРЖКИ")
@@ -50,8 +97,11 @@ def main() -> None:
     print(f"🚀 MCP Server: http://0.0.0.0:{PORT}/mcp")
     print("=" * 60)
 
-    # Официальный SDK: транспорт задаём только тут
-    mcp.run(transport="streamable-http")
+    # Официальный SDK: транспорт задаём только тут.
+    # Запускаем так же, как mcp.run(transport="streamable-http"), но в своей
+    # корутине, чтобы на остановке закрыть пул соединений к GitHub.
+    # uvloop (libuv) заметно быстрее стандартного цикла на сетевой нагрузке.
+    anyio.run(serve, backend_options={"use_uvloop": uvloop is not None})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,587 @@
+"""Короткоживущий in-process кэш ответов GitHub API по тикетам."""
+
+import asyncio
+from functools import lru_cache
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+import httpx
+import orjson
+from cachetools import LRUCache, TTLCache
+
+from ._http import github_request, graphql
+
+# Инструменты часто вызываются цепочкой по одному и тому же тикету
+# (classify → analyze → answer). 30 секунд хватает, чтобы не ходить
+# в GitHub повторно за теми же данными, и не успевает заметно устареть.
+CACHE_TTL = 30.0
+
+_cache: TTLCache = TTLCache(maxsize=1024, ttl=CACHE_TTL)
+_locks: Dict[Hashable, asyncio.Lock] = {}
+
+# ETag последнего ответа по URL живёт дольше TTL-кэша: по истечении TTL
+# данные не перезапрашиваются целиком, а ревалидируются через If-None-Match.
+# Ответ 304 не расходует rate limit GitHub и не несёт тела.
+_validators: LRUCache = LRUCache(maxsize=1024)
+
+# Страница комментариев по максимуму: у большинства тикетов их меньше сотни,
+# и тогда хвост приходит одним запросом
+COMMENTS_PAGE_SIZE = 100
+
+
+@lru_cache(maxsize=32)
+def issues_path(repo: str) -> str:
+    """Префикс /repos/{repo}/issues — собирается один раз на репозиторий."""
+    return f"/repos/{repo}/issues"
+
+
+def _thin_issue(d: Dict[str, Any]) -> Dict[str, Any]:
+    """Только те поля issue, которые читают инструменты."""
+    return {
+        "title": d.get("title") or "",
+        "body": d.get("body") or "",
+        "state": d.get("state") or "",
+        "html_url": d.get("html_url") or "",
+        "labels": [l.get("name", "") for l in d.get("labels") or []],
+        "comments": d.get("comments") or 0,
+        "author": (d.get("user") or {}).get("login") or "unknown",
+        "is_pr": "pull_request" in d,
+    }
+
+
+def _thin_comments(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Только те поля комментариев, которые читают инструменты."""
+    return [
+        {
+            "body": c.get("body") or "",
+            "author": (c.get("user") or {}).get("login") or "unknown",
+            "created_at": c.get("created_at") or "",
+        }
+        for c in items
+    ]
+
+
+async def _conditional_get(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: Mapping[str, str],
+    params: Optional[Dict[str, Any]] = None,
+    transform: Optional[Callable[[Any], Any]] = None,
+) -> Tuple[Any, Dict[str, Any]]:
+    """Как conditional_get, но дополнительно возвращает разобранный Link."""
+    key = (url, tuple(sorted((params or {}).items())))
+    cached = _validators.get(key)
+
+    req_headers = dict(headers)
+    if cached is not None:
+        req_headers["If-None-Match"] = cached[0]
+
+    resp = await github_request(client, "GET", url, headers=req_headers, params=params)
+    if resp.status_code == 304 and cached is not None:
+        return cached[1], cached[2]
+
+    resp.raise_for_status()
+    # orjson разбирает bytes напрямую и заметно быстрее stdlib json
+    data = orjson.loads(resp.content)
+    if transform is not None:
+        data = transform(data)
+    links = resp.links
+    if etag := resp.headers.get("ETag"):
+        _validators[key] = (etag, data, links)
+    return data, links
+
+
+async def conditional_get(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: Mapping[str, str],
+    params: Optional[Dict[str, Any]] = None,
+    transform: Optional[Callable[[Any], Any]] = None,
+) -> Any:
+    """
+    GET с ревалидацией по ETag.
+
+    Если для URL уже есть сохранённый ETag, отправляет If-None-Match
+    и на 304 возвращает ранее полученные данные. transform применяется
+    к разобранному ответу до сохранения — в памяти живёт только его результат.
+    """
+    data, _ = await _conditional_get(client, url, headers, params, transform)
+    return data
+
+
+# Постраничная выгрузка списков: сколько страниц запрашивать одновременно
+# (больше — риск упереться в secondary rate limit GitHub) и сколько всего
+PAGES_CONCURRENCY = 8
+MAX_PAGES = 50
+
+
+async def fetch_all_pages(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: Mapping[str, str],
+    params: Dict[str, Any],
+    transform: Callable[[Any], List[Any]],
+) -> List[Any]:
+    """
+    Все страницы списка (не больше MAX_PAGES), склеенные в один список.
+
+    Первая страница сообщает номер последней (Link: rel="last"), остальные
+    запрашиваются параллельно — не больше PAGES_CONCURRENCY одновременно.
+    Каждая страница ревалидируется по ETag, как в conditional_get.
+    """
+    first, links = await _conditional_get(client, url, headers, params, transform)
+    last_page = min(_page_number(links.get("last")) or 1, MAX_PAGES)
+    if last_page <= 1:
+        return first
+
+    sem = asyncio.Semaphore(PAGES_CONCURRENCY)
+
+    async def page(n: int) -> List[Any]:
+        async with sem:
+            return await conditional_get(
+                client, url, headers, {**params, "page": n}, transform
+            )
+
+    rest = await asyncio.gather(*(page(n) for n in range(2, last_page + 1)))
+    return [item for chunk in (first, *rest) for item in chunk]
+
+
+async def _cached(key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Значение из кэша по ключу, а при промахе — результат load().
+
+    Одновременные промахи по одному ключу склеиваются: в GitHub уходит
+    один запрос, остальные вызовы ждут его результат.
+    """
+    if (data := _cache.get(key)) is not None:
+        return data
+
+    lock = _locks.setdefault(key, asyncio.Lock())
+    try:
+        async with lock:
+            # Пока ждали блокировку, соседний вызов мог уже заполнить кэш
+            if (data := _cache.get(key)) is not None:
+                return data
+
+            data = await load()
+            _cache[key] = data
+            return data
+    finally:
+        if _locks.get(key) is lock and not lock.locked():
+            del _locks[key]
+
+
+async def fetch_issue(
+    client: httpx.AsyncClient,
+    repo: str,
+    issue_number: int,
+    headers: Mapping[str, str],
+) -> Dict[str, Any]:
+    """
+    Issue (GET /repos/{repo}/issues/{n}), с кэшированием.
+
+    Возвращает укороченный dict: title, body, state, html_url, labels (имена),
+    comments (количество), author, is_pr.
+    """
+    url = f"{issues_path(repo)}/{issue_number}"
+    return await _cached(
+        (repo, issue_number, "issue"),
+        lambda: conditional_get(client, url, headers, transform=_thin_issue),
+    )
+
+
+async def revalidate_issue(
+    client: httpx.AsyncClient,
+    repo: str,
+    issue_number: int,
+    headers: Mapping[str, str],
+) -> Dict[str, Any]:
+    """
+    Как fetch_issue, но мимо TTL-кэша: всегда спрашивает GitHub (с If-None-Match).
+
+    Для инструментов, которые пишут в тикет на основе текущего состояния:
+    если тикет не менялся, GitHub отвечает 304 без тела и без расхода rate limit.
+    """
+    url = f"{issues_path(repo)}/{issue_number}"
+    issue = await conditional_get(client, url, headers, transform=_thin_issue)
+    _cache[(repo, issue_number, "issue")] = issue
+    return issue
+
+
+def _page_number(link: Optional[Dict[str, str]]) -> Optional[int]:
+    if not link:
+        return None
+    page = httpx.URL(link["url"]).params.get("page")
+    return int(page) if page else None
+
+
+def _tail_pages(total: int, limit: int) -> Tuple[int, List[int]]:
+    """
+    per_page и номера страниц, покрывающие последние `limit` из `total`
+    комментариев: по возможности одна страница минимального размера.
+    """
+    first = max(total - limit, 0)
+    last = total - 1
+    for per_page in range(limit, COMMENTS_PAGE_SIZE + 1):
+        if first // per_page == last // per_page:
+            return per_page, [last // per_page + 1]
+    return limit, [first // limit + 1, last // limit + 1]
+
+
+async def _fetch_comments_tail(
+    client: httpx.AsyncClient,
+    repo: str,
+    issue_number: int,
+    headers: Mapping[str, str],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    # GitHub отдаёт комментарии issue только от старых к новым (sort/direction
+    # этот endpoint игнорирует), поэтому хвост берём с последних страниц.
+    url = f"{issues_path(repo)}/{issue_number}/comments"
+
+    # Если issue уже в кэше, число комментариев известно и можно сразу
+    # запросить ровно те страницы (и такого размера), где лежит хвост
+    issue = _cache.get((repo, issue_number, "issue"))
+    if issue is not None:
+        total = issue["comments"]
+        if not total:
+            return []
+        per_page, pages = _tail_pages(total, limit)
+        chunks = await asyncio.gather(
+            *(
+                conditional_get(
+                    client,
+                    url,
+                    headers,
+                    {"per_page": per_page, "page": page},
+                    _thin_comments,
+                )
+                for page in pages
+            )
+        )
+        return [c for chunk in chunks for c in chunk][-limit:]
+
+    # Иначе — первая страница по максимуму и номер последней из Link: rel="last"
+    params = {"per_page": COMMENTS_PAGE_SIZE}
+    comments, links = await _conditional_get(
+        client, url, headers, params, _thin_comments
+    )
+    last_page = _page_number(links.get("last"))
+    if last_page is None or last_page <= 1:
+        return comments[-limit:]
+
+    comments = await conditional_get(
+        client, url, headers, {**params, "page": last_page}, _thin_comments
+    )
+    if len(comments) < limit:
+        prev = await conditional_get(
+            client, url, headers, {**params, "page": last_page - 1}, _thin_comments
+        )
+        comments = prev + comments
+    return comments[-limit:]
+
+
+async def fetch_comments(
+    client: httpx.AsyncClient,
+    repo: str,
+    issue_number: int,
+    headers: Mapping[str, str],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """
+    Последние `limit` комментариев к issue в хронологическом порядке,
+    с кэшированием. Каждый комментарий — dict с body, author, created_at.
+    """
+    return await _cached(
+        (repo, issue_number, "comments", limit),
+        lambda: _fetch_comments_tail(client, repo, issue_number, headers, limit),
+    )
+
+
+_ISSUE_WITH_COMMENTS_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $last: Int!) {
+  repository(owner: $owner, name: $name) {
+    issueOrPullRequest(number: $number) {
+      __typename
+      ... on Issue {
+        title
+        body
+        state
+        url
+        author { login }
+        labels(first: 100) { nodes { name } }
+        comments(last: $last) {
+          totalCount
+          nodes { body createdAt author { login } }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+async def fetch_issue_and_comments(
+    client: httpx.AsyncClient,
+    repo: str,
+    issue_number: int,
+    headers: Mapping[str, str],
+    limit: int,
+    use_graphql: bool,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    fetch_issue и fetch_comments(limit) вместе (при limit=0 комментарии не
+    запрашиваются).
+
+    С use_graphql (нужен токен) при промахе кэша — одним GraphQL-запросом
+    вместо двух REST; результат кладётся в те же ключи кэша. Если GraphQL
+    не вернул issue (нет такого номера или это pull request), данные
+    берутся через REST — как и без токена.
+    """
+    issue_key = (repo, issue_number, "issue")
+    comments_key = (repo, issue_number, "comments", limit)
+    cached_issue = _cache.get(issue_key)
+    cached_comments = _cache.get(comments_key) if limit > 0 else []
+    graphql_ok = use_graphql and 0 < limit <= 100
+
+    if graphql_ok and (cached_issue is None or cached_comments is None):
+        owner, name = repo.split("/", 1)
+        resp = await graphql(
+            client,
+            headers,
+            _ISSUE_WITH_COMMENTS_QUERY,
+            {"owner": owner, "name": name, "number": issue_number, "last": limit},
+        )
+        node = ((resp.get("data") or {}).get("repository") or {}).get(
+            "issueOrPullRequest"
+        )
+        if node is not None and node["__typename"] == "Issue":
+            issue = {
+                "title": node["title"] or "",
+                "body": node["body"] or "",
+                "state": node["state"].lower(),
+                "html_url": node["url"] or "",
+                "labels": [l["name"] for l in node["labels"]["nodes"]],
+                "comments": node["comments"]["totalCount"],
+                "author": (node["author"] or {}).get("login") or "unknown",
+                "is_pr": False,
+            }
+            comments = [
+                {
+                    "body": c["body"] or "",
+                    "author": (c["author"] or {}).get("login") or "unknown",
+                    "created_at": c["createdAt"] or "",
+                }
+                for c in node["comments"]["nodes"]
+            ]
+            _cache[issue_key] = issue
+            _cache[comments_key] = comments
+            return issue, comments
+
+    if limit <= 0:
+        return await fetch_issue(client, repo, issue_number, headers), []
+    issue, comments = await asyncio.gather(
+        fetch_issue(client, repo, issue_number, headers),
+        fetch_comments(client, repo, issue_number, headers, limit),
+    )
+    return issue, comments
+
+
+_REPO_META_QUERY = """
+query($owner: String!, $name: String!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    id
+    labels(first: 100, after: $after) {
+      pageInfo { hasNextPage endCursor }
+      nodes { id name }
+    }
+  }
+}
+"""
+
+
+async def fetch_repo_meta(
+    client: httpx.AsyncClient,
+    repo: str,
+    headers: Mapping[str, str],
+) -> Dict[str, Any]:
+    """
+    Node ID репозитория и его меток (GraphQL), с кэшированием.
+
+    Возвращает {"id": ..., "labels": {имя метки: node ID}}. Метки читаются
+    постранично, пока GitHub сообщает hasNextPage.
+    """
+
+    async def load() -> Dict[str, Any]:
+        owner, name = repo.split("/", 1)
+        variables: Dict[str, Any] = {"owner": owner, "name": name}
+        labels: Dict[str, str] = {}
+        while True:
+            resp = await graphql(client, headers, _REPO_META_QUERY, variables)
+            node = (resp.get("data") or {}).get("repository")
+            if node is None:
+                errors = resp.get("errors") or [{}]
+                raise RuntimeError(
+                    f"GraphQL: репозиторий {repo} не найден: "
+                    f"{errors[0].get('message')}"
+                )
+            page = node["labels"]
+            labels.update((l["name"], l["id"]) for l in page["nodes"])
+            if not page["pageInfo"]["hasNextPage"]:
+                return {"id": node["id"], "labels": labels}
+            variables["after"] = page["pageInfo"]["endCursor"]
+
+    return await _cached((repo, "meta"), load)
+
+
+# Поля тикета для get_ticket_detail / get_tickets_details. Алиасы совпадают
+# с ключами issue_details, поэтому ответ почти не нужно перекладывать.
+# Pull request не попадает под фрагмент — для него приходит только __typename.
+_ISSUE_FIELDS = """
+fragment IssueFields on Issue {
+  id: databaseId
+  number
+  title
+  body
+  state
+  created_at: createdAt
+  updated_at: updatedAt
+  url
+  author { login }
+  assignees(first: 1) { nodes { login } }
+  labels(first: 100) { nodes { name } }
+  comments { totalCount }
+}
+"""
+
+
+def issue_details(issue: Dict[str, Any]) -> Dict[str, Any]:
+    """Детали тикета из ответа REST API (GET /repos/{repo}/issues/{n})."""
+    return {
+        "id": issue.get("id"),
+        "number": issue.get("number"),
+        "title": issue.get("title"),
+        "body": issue.get("body") or "",
+        "state": issue.get("state"),
+        "created_at": issue.get("created_at"),
+        "updated_at": issue.get("updated_at"),
+        "url": issue.get("html_url"),
+        "user": issue.get("user", {}).get("login"),
+        "assignee": (issue.get("assignee") or {}).get("login"),
+        "labels": [lbl.get("name", "") for lbl in issue.get("labels", [])],
+        "comments": issue.get("comments", 0),
+    }
+
+
+async def fetch_issue_details(
+    client: httpx.AsyncClient,
+    repo: str,
+    headers: Mapping[str, str],
+    numbers: List[int],
+) -> Dict[int, Optional[Dict[str, Any]]]:
+    """
+    Детали нескольких тикетов одним GraphQL-запросом (требует токен),
+    в том же формате, что issue_details.
+
+    None для номера, по которому GraphQL не вернул issue (нет такого номера
+    или это pull request), — такие номера вызывающий код проверяет через REST.
+    """
+    owner, name = repo.split("/", 1)
+    params = ["$owner: String!", "$name: String!"]
+    fields = []
+    variables: Dict[str, Any] = {"owner": owner, "name": name}
+    for i, number in enumerate(numbers):
+        params.append(f"$n{i}: Int!")
+        fields.append(
+            f"i{i}: issueOrPullRequest(number: $n{i}) {{ __typename ...IssueFields }}"
+        )
+        variables[f"n{i}"] = number
+
+    query = (
+        f"query({', '.join(params)}) {{ repository(owner: $owner, name: $name) "
+        f"{{ {' '.join(fields)} }} }}{_ISSUE_FIELDS}"
+    )
+    resp = await graphql(client, headers, query, variables)
+    node = (resp.get("data") or {}).get("repository") or {}
+
+    found: Dict[int, Optional[Dict[str, Any]]] = {}
+    for i, number in enumerate(numbers):
+        issue = node.get(f"i{i}")
+        if issue is None or issue.pop("__typename") != "Issue":
+            found[number] = None
+            continue
+        assignees = issue.pop("assignees")["nodes"]
+        issue["body"] = issue["body"] or ""
+        issue["state"] = issue["state"].lower()
+        issue["user"] = (issue.pop("author") or {}).get("login")
+        issue["assignee"] = assignees[0]["login"] if assignees else None
+        issue["labels"] = [lbl["name"] for lbl in issue["labels"]["nodes"]]
+        issue["comments"] = issue["comments"]["totalCount"]
+        found[number] = issue
+    return found
+
+
+async def ensure_labels(
+    client: httpx.AsyncClient,
+    repo: str,
+    headers: Mapping[str, str],
+    names: Iterable[str],
+) -> Dict[str, Any]:
+    """
+    fetch_repo_meta, в котором заведены недостающие метки из names.
+
+    Каждая недостающая метка создаётся один раз (POST /labels, параллельно)
+    и сразу попадает в закэшированный словарь меток. Метки, которые создать
+    не удалось, в словаре отсутствуют — вызывающий код решает, что с ними делать.
+    """
+    meta = await fetch_repo_meta(client, repo, headers)
+    label_ids: Dict[str, str] = meta["labels"]
+    missing = [name for name in dict.fromkeys(names) if name not in label_ids]
+    if not missing:
+        return meta
+
+    url = f"/repos/{repo}/labels"
+    responses = await asyncio.gather(
+        *(
+            github_request(client, "POST", url, headers=headers, json={"name": name})
+            for name in missing
+        ),
+        return_exceptions=True,
+    )
+    for name, resp in zip(missing, responses):
+        if isinstance(resp, httpx.Response) and resp.status_code == 201:
+            label_ids[name] = orjson.loads(resp.content)["node_id"]
+    return meta
+
+
+def invalidate_issue(repo: str, issue_number: int) -> None:
+    """Сбрасывает всё закэшированное по тикету (после записи в него)."""
+    for key in list(_cache.keys()):
+        if key[:2] == (repo, issue_number):
+            _cache.pop(key, None)
+
+
+def remember_issue(
+    repo: str, issue_number: int, data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Кладёт в кэш свежий issue из ответа на запись (PATCH),
+    чтобы следующий инструмент не перезапрашивал его.
+
+    Возвращает тот же укороченный dict, что и fetch_issue.
+    """
+    issue = _thin_issue(data)
+    _cache[(repo, issue_number, "issue")] = issue
+    # после записи сохранённый ETag всё равно устарел
+    _validators.pop((f"{issues_path(repo)}/{issue_number}", ()), None)
+    return issue
@@ -0,0 +1,214 @@
+"""Общий HTTP-клиент для обращений к GitHub API."""
+
+import asyncio
+import random
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import httpx
+import orjson
+
+GITHUB_API_URL = "https://api.github.com"
+
+# Заголовки по умолчанию для всех запросов к GitHub. В запросах передаётся
+# только Authorization — httpx сам сливает его с заголовками клиента.
+BASE_HEADERS: Mapping[str, str] = MappingProxyType(
+    {
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+        # GitHub просит указывать в User-Agent имя приложения
+        "User-Agent": "support-mcp",
+    }
+)
+
+# Ответы, после которых запрос стоит повторить: rate limit и временные
+# ошибки прокси GitHub. POST повторяется только на rate limit — 502/503
+# могли прийти уже после того, как GitHub выполнил запрос.
+RETRY_STATUSES = frozenset({429, 502, 503})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "PATCH", "DELETE"})
+MAX_ATTEMPTS = 4
+MAX_RETRY_DELAY = 30.0
+
+# Когда в лимите GitHub остаётся меньше RATE_LIMIT_RESERVE запросов, следующие
+# запросы к тому же ресурсу ждут его сброса, а не получают 403 всей пачкой.
+# Если до сброса дольше MAX_RETRY_DELAY, ждать нет смысла — запрос уходит сразу.
+RATE_LIMIT_RESERVE = 2
+
+# Сколько запросов к GitHub процесс держит одновременно. Пачка параллельных
+# вызовов инструментов иначе быстро упирается в secondary rate limit.
+MAX_CONCURRENT_REQUESTS = 16
+
+_request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+# ресурс лимита (core/search/graphql) -> (осталось запросов, время сброса)
+_rate_limits: Dict[str, Tuple[int, float]] = {}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Возвращает общий на весь процесс httpx.AsyncClient для GitHub API.
+
+    Клиент создаётся лениво при первом обращении и держит пул keep-alive
+    соединений, поэтому инструменты не платят за TCP+TLS handshake
+    на каждом вызове. HTTP/2 позволяет параллельным запросам идти по одному
+    соединению, а JSON-ответы GitHub приходят сжатыми (gzip).
+    Заголовки BASE_HEADERS выставлены на клиенте, Authorization
+    передаётся в каждом запросе.
+    """
+    global _client
+
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=GITHUB_API_URL,
+            timeout=20.0,
+            headers={**BASE_HEADERS, "Accept-Encoding": "gzip"},
+            # transport сам повторяет неудавшееся соединение (не HTTP-ответы)
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,
+                # keep-alive дольше дефолтных 5 с: соединение переживает
+                # паузу между вызовами инструментов
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=30.0,
+                ),
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Закрывает общий клиент (вызывается при остановке сервера)."""
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _resource(url: str) -> str:
+    """Ресурс лимита GitHub, к которому относится запрос."""
+    path = httpx.URL(url).path
+    if path.startswith("/search/"):
+        return "search"
+    if path == "/graphql":
+        return "graphql"
+    return "core"
+
+
+def _record_rate_limit(resp: httpx.Response) -> None:
+    try:
+        remaining = int(resp.headers["X-RateLimit-Remaining"])
+        reset = float(resp.headers["X-RateLimit-Reset"])
+    except (KeyError, ValueError):
+        return
+    resource = resp.headers.get("X-RateLimit-Resource") or _resource(str(resp.url))
+    _rate_limits[resource] = (remaining, reset)
+
+
+def _reset_delay(reset: float) -> Optional[float]:
+    """Сколько ждать сброса лимита; None, если ждать слишком долго."""
+    delay = max(reset - time.time(), 0.0)
+    return delay if delay <= MAX_RETRY_DELAY else None
+
+
+async def _wait_rate_limit(url: str) -> None:
+    state = _rate_limits.get(_resource(url))
+    if state is None or state[0] >= RATE_LIMIT_RESERVE:
+        return
+    if delay := _reset_delay(state[1]):
+        await asyncio.sleep(delay)
+
+
+def _exhausted_reset(resp: httpx.Response) -> Optional[float]:
+    """Пауза до сброса лимита для 403 с X-RateLimit-Remaining: 0."""
+    if resp.headers.get("X-RateLimit-Remaining") != "0":
+        return None
+    try:
+        return _reset_delay(float(resp.headers["X-RateLimit-Reset"]))
+    except (KeyError, ValueError):
+        return None
+
+
+def _should_retry(method: str, resp: httpx.Response) -> bool:
+    if resp.status_code == 429 or (
+        resp.status_code == 403
+        and ("Retry-After" in resp.headers or _exhausted_reset(resp) is not None)
+    ):
+        # primary/secondary rate limit — запрос не выполнялся
+        return True
+    return resp.status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+
+
+def _retry_delay(resp: httpx.Response, attempt: int) -> float:
+    try:
+        delay = float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        delay = _exhausted_reset(resp)
+        if delay is None:
+            # случайная добавка разводит повторы параллельных запросов
+            delay = 2.0**attempt + random.random()
+    return min(delay, MAX_RETRY_DELAY)
+
+
+async def github_request(
+    client: httpx.AsyncClient, method: str, url: str, **kwargs: Any
+) -> httpx.Response:
+    """
+    client.request с повтором на rate limit (429, 403 с Retry-After или
+    исчерпанным X-RateLimit-Remaining) и временные 502/503.
+
+    Пауза — Retry-After из ответа, время сброса лимита, иначе 1, 2, 4 секунды
+    со случайной добавкой до секунды. Одновременно выполняется не больше
+    MAX_CONCURRENT_REQUESTS запросов; паузы между попытками слот не занимают.
+    Заголовки X-RateLimit-* каждого ответа запоминаются: если лимит почти
+    исчерпан, следующий запрос сначала ждёт его сброса. Ответ последней
+    попытки возвращается как есть: raise_for_status вызывает вызывающий код.
+    Тело json= кодируется через orjson.
+    """
+    method = method.upper()
+    if "json" in kwargs:
+        # тело запроса кодируется orjson, а не stdlib json внутри httpx,
+        # и один раз на все попытки
+        kwargs["content"] = orjson.dumps(kwargs.pop("json"))
+        kwargs["headers"] = {
+            **(kwargs.get("headers") or {}),
+            "Content-Type": "application/json",
+        }
+    for attempt in range(MAX_ATTEMPTS):
+        await _wait_rate_limit(url)
+        async with _request_slots:
+            resp = await client.request(method, url, **kwargs)
+        _record_rate_limit(resp)
+        if attempt == MAX_ATTEMPTS - 1 or not _should_retry(method, resp):
+            break
+        await resp.aclose()
+        await asyncio.sleep(_retry_delay(resp, attempt))
+    return resp
+
+
+async def graphql(
+    client: httpx.AsyncClient,
+    headers: Mapping[str, str],
+    query: str,
+    variables: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Запрос к GitHub GraphQL API (требует токен в headers).
+
+    Возвращает ответ целиком — {"data": ..., "errors": [...]}: при частичной
+    ошибке GitHub отдаёт 200 с данными по успешным полям и списком errors.
+    """
+    resp = await github_request(
+        client,
+        "POST",
+        "/graphql",
+        headers=headers,
+        json={"query": query, "variables": variables or {}},
+    )
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
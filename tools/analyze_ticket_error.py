@@ -1,21 +1,63 @@
 """Инструмент для анализа ошибок / логов в тикете GitHub."""
 
-import os
+import asyncio
 import textwrap
+import time
 from typing import Any, Dict, List, Optional
 
 import httpx
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import (
+    ToolResult,
+    budget_prompt,
+    github_config,
+    log_info,
+    maybe_progress,
+    tool_span,
+    trim_comment,
+)
+from ._gh_cache import fetch_comments, fetch_issue
+from ._http import get_client
 from .post_ticket_reply import post_ticket_reply
 
 tracer = trace.get_tracer(__name__)
 
+# Ограничение размера контекста для модели (чтобы не убить модель).
+# Режем отдельные поля до сборки, а не готовую строку целиком.
+MAX_CONTEXT_CHARS = 8000
+MAX_BODY_CHARS = 4000
+MAX_COMMENT_CHARS = 1500
+# Итоговый промпт целиком (~1700 токенов)
+MAX_PROMPT_CHARS = 6000
+
+# Шаблон промпта постоянен — dedent делаем один раз при импорте
+_PROMPT_TMPL = textwrap.dedent(
+    """
+    Ты — опытный инженер поддержки и разработчик (backend/devops).
+
+    По приведённому ниже тикету (описание + комментарии) проанализируй:
+    1. Какую проблему описывает пользователь.
+    2. Какие ошибки/логи/стектрейсы присутствуют.
+    3. Что, с высокой вероятностью, является причиной проблемы.
+    4. Какие шаги диагностики можно предложить (пошагово).
+    5. Какие варианты решения можно предложить (конкретные действия).
+    6. Если не хватает данных — явно укажи, что нужно уточнить.
+
+    Пиши по-русски, структурировано, с подзаголовками и списками.
+
+    === НАЧАЛО ТИКЕТА ===
+    {{CTX}}
+    === КОНЕЦ ТИКЕТА ===
+    """
+).strip()
+_PROMPT_HEAD, _PROMPT_TAIL = _PROMPT_TMPL.split("{{CTX}}")
+
 
 @mcp.tool()
 async def analyze_ticket_error(
@@ -47,112 +89,93 @@ async def analyze_ticket_error(
        - возможные фиксы.
     4) (опционально) оставляет комментарий с анализом в GitHub.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("analyze_ticket_error") as span:
-        span.set_attribute("issue_number", issue_number)
-        span.set_attribute("comments_limit", comments_limit)
-        span.set_attribute("post_comment", post_comment)
-
+    with tool_span(
+        tracer,
+        "analyze_ticket_error",
+        issue_number=issue_number,
+        comments_limit=comments_limit,
+        post_comment=post_comment,
+    ):
         try:
-            await ctx.info(f"🧠 Анализируем ошибку / логи по тикету #{issue_number}")
+            started = time.monotonic()
+            await log_info(ctx, f"🧠 Анализируем ошибку / логи по тикету #{issue_number}")
             await ctx.report_progress(progress=0, total=100)
 
             # 1) Настройки GitHub
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")  # для публичных реп может быть пустым
-            span.set_attribute("github_repo", repo)
-
-            headers: Dict[str, str] = {"Accept": "application/vnd.github+json"}
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
-
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                # 2) Забираем сам issue
-                issue_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-                resp_issue = await client.get(issue_url, headers=headers)
-                resp_issue.raise_for_status()
-                issue: Dict[str, Any] = resp_issue.json()
-
-                title: str = issue.get("title") or ""
-                body: str = issue.get("body") or ""
-
-                # 3) Последние комментарии
-                comments_text_parts: List[str] = []
-                if comments_limit > 0:
-                    comments_url = f"{issue_url}/comments"
-                    # GitHub не сортирует по updated, поэтому берём побольше и сами режем
-                    resp_comments = await client.get(
-                        comments_url,
-                        headers=headers,
-                        params={"per_page": max(comments_limit, 10)},
+            repo, token, headers = github_config()  # token для публичных реп может быть пустым
+
+            client = get_client()
+
+            # 2) Запрос комментариев не зависит от ответа по issue —
+            #    запускаем его сразу, параллельно с запросом самого issue
+            comments_task: Optional[asyncio.Task] = None
+            if comments_limit > 0:
+                comments_task = asyncio.create_task(
+                    fetch_comments(client, repo, issue_number, headers, comments_limit)
+                )
+
+            try:
+                issue: Dict[str, Any] = await fetch_issue(
+                    client, repo, issue_number, headers
+                )
+                comments: List[Dict[str, Any]] = (
+                    await comments_task if comments_task else []
+                )
+            finally:
+                # если issue не получили — комментарии уже не нужны
+                if comments_task is not None:
+                    comments_task.cancel()
+
+            title: str = issue["title"]
+            body: str = issue["body"][-MAX_BODY_CHARS:]
+
+            # 3) Последние комментарии
+            comments_text_parts: List[str] = []
+            if comments:
+                # остаток бюджета делим поровну между комментариями
+                comment_budget = min(
+                    MAX_COMMENT_CHARS,
+                    (MAX_CONTEXT_CHARS - MAX_BODY_CHARS) // len(comments),
+                )
+                # fetch_comments уже отдаёт последние N в хронологическом порядке
+                for c in comments:
+                    author = c["author"]
+                    text = trim_comment(c["body"], comment_budget)
+                    comments_text_parts.append(
+                        f"[Комментарий от {author}]\n{text}"
                     )
-                    resp_comments.raise_for_status()
-                    comments: List[Dict[str, Any]] = resp_comments.json()
-
-                    # Берём последние N (по created_at)
-                    comments_sorted = sorted(
-                        comments,
-                        key=lambda c: c.get("created_at") or "",
-                    )[-comments_limit:]
-
-                    for c in comments_sorted:
-                        author = (c.get("user") or {}).get("login") or "unknown"
-                        text = c.get("body") or ""
-                        comments_text_parts.append(
-                            f"[Комментарий от {author}]\n{text}"
-                        )
-
-            await ctx.report_progress(progress=30, total=100)
-
-            # 4) Собираем контекст для модели
-            issue_context_parts: List[str] = [
-                f"Тикет #{issue_number}",
-                f"Заголовок:\n{title}",
-                "",
-                f"Описание тикета:\n{body}",
-            ]
+
+            await maybe_progress(ctx, 30, started)
+
+            # 4) Собираем контекст для модели: номер и заголовок сохраняем
+            #    всегда, а описание + комментарии при нехватке места режем с начала
+            issue_head = "\n\n".join(
+                [f"Тикет #{issue_number}", f"Заголовок:\n{title}", "", ""]
+            )
+            issue_context_parts: List[str] = [f"Описание тикета:\n{body}"]
             if comments_text_parts:
                 issue_context_parts.append("\nПоследние комментарии:")
                 issue_context_parts.extend(comments_text_parts)
 
             issue_context = "\n\n".join(issue_context_parts)
 
-            # На всякий случай ограничим размер (чтобы не убить модель)
-            max_chars = 8000
-            if len(issue_context) > max_chars:
-                issue_context = issue_context[-max_chars:]
-
             # 5) Промпт для анализа
-            prompt_text = textwrap.dedent(
-                f"""
-                Ты — опытный инженер поддержки и разработчик (backend/devops).
-
-                По приведённому ниже тикету (описание + комментарии) проанализируй:
-                1. Какую проблему описывает пользователь.
-                2. Какие ошибки/логи/стектрейсы присутствуют.
-                3. Что, с высокой вероятностью, является причиной проблемы.
-                4. Какие шаги диагностики можно предложить (пошагово).
-                5. Какие варианты решения можно предложить (конкретные действия).
-                6. Если не хватает данных — явно укажи, что нужно уточнить.
-
-                Пиши по-русски, структурировано, с подзаголовками и списками.
-
-                === НАЧАЛО ТИКЕТА ===
-                {issue_context}
-                === КОНЕЦ ТИКЕТА ===
-                """
-            ).strip()
+            prompt_text = budget_prompt(
+                _PROMPT_HEAD + issue_head,
+                _PROMPT_TAIL,
+                issue_context,
+                max_chars=MAX_PROMPT_CHARS,
+            )
 
-            await ctx.report_progress(progress=50, total=100)
+            await maybe_progress(ctx, 50, started)
 
             ai_answer = await ctx.prompt(prompt_text)
             analysis_text = ai_answer if isinstance(ai_answer, str) else str(ai_answer)
 
-            await ctx.report_progress(progress=80, total=100)
+            await maybe_progress(ctx, 80, started)
 
             # 6) (опционально) публикуем комментарий в тикете
             comment_url: Optional[str] = None
@@ -178,7 +201,7 @@ async def analyze_ticket_error(
             )
             )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=human_text)],
                 structured_content={
                     "issue_number": issue_number,
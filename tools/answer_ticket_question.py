@@ -1,20 +1,38 @@
 """Инструмент для ответа AI на вопрос пользователя в тикете (/ask-ai)."""
 
-import os
+import asyncio
+import time
 from typing import Any, Dict, List, Optional
 
 import httpx
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import (
+    ToolResult,
+    budget_prompt,
+    github_config,
+    log_info,
+    maybe_progress,
+    tool_span,
+    trim_comment,
+)
+from ._gh_cache import fetch_comments, fetch_issue
+from ._http import get_client
 from .post_ticket_reply import post_ticket_reply
 
 tracer = trace.get_tracer(__name__)
 
+# Итоговый промпт целиком (~1700 токенов)
+MAX_PROMPT_CHARS = 6000
+# Описание тикета в промпте: вместе с инструкцией и последним сообщением
+# (trim_comment, до 1500 символов) должно оставлять место комментариям
+MAX_BODY_CHARS = 2500
+
 
 @mcp.tool()
 async def answer_ticket_question(
@@ -43,24 +61,24 @@ async def answer_ticket_question(
     3) Просим модель сформулировать ответ.
     4) Публикуем ответ в GitHub комментарием.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("answer_ticket_question") as span:
-        span.set_attribute("issue_number", issue_number)
-        span.set_attribute("comments_limit", comments_limit)
-
+    with tool_span(
+        tracer,
+        "answer_ticket_question",
+        issue_number=issue_number,
+        comments_limit=comments_limit,
+    ):
         try:
-            await ctx.info(
+            started = time.monotonic()
+            await log_info(
+                ctx,
                 f"💬 Формируем ответ AI для тикета #{issue_number}"
             )
             await ctx.report_progress(progress=0, total=100)
 
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
-            span.set_attribute("github_repo", repo)
+            repo, token, headers = github_config()
 
             if not token:
                 msg = "Для публикации ответа требуется GITHUB_TOKEN с правами записи."
@@ -72,87 +90,97 @@ async def answer_ticket_question(
                     )
                 )
 
-            headers: Dict[str, str] = {"Accept": "application/vnd.github+json"}
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
-
-            base_issue_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                # 1) Сам тикет
-                resp_issue = await client.get(base_issue_url, headers=headers)
-                resp_issue.raise_for_status()
-                issue: Dict[str, Any] = resp_issue.json()
-
-                if "pull_request" in issue:
-                    msg = "Указан номер pull request, а не обычного issue."
-                    await ctx.error(msg)
-                    raise McpError(
-                        ErrorData(
-                            code=-32602,
-                            message=msg,
-                        )
-                    )
+            client = get_client()
 
-                title: str = issue.get("title") or ""
-                body: str = issue.get("body") or ""
-                author: str = (issue.get("user") or {}).get("login") or "unknown"
+            # 1) Тикет и его комментарии запрашиваем параллельно:
+            #    URL комментариев известен заранее
+            comments_task = asyncio.create_task(
+                fetch_comments(client, repo, issue_number, headers, comments_limit)
+            )
+            try:
+                issue: Dict[str, Any] = await fetch_issue(
+                    client, repo, issue_number, headers
+                )
+                comments: List[Dict[str, Any]] = await comments_task
+            finally:
+                comments_task.cancel()
 
-                # 2) Последние комментарии
-                comments_url = f"{base_issue_url}/comments"
-                resp_comments = await client.get(
-                    comments_url,
-                    headers=headers,
-                    params={"per_page": max(10, comments_limit)},
+            # PR отсекаем уже после обоих запросов — комментарии просто выбрасываем
+            if issue["is_pr"]:
+                msg = "Указан номер pull request, а не обычного issue."
+                await ctx.error(msg)
+                raise McpError(
+                    ErrorData(
+                        code=-32602,
+                        message=msg,
+                    )
                 )
-                resp_comments.raise_for_status()
-                comments: List[Dict[str, Any]] = resp_comments.json()
 
-            await ctx.report_progress(progress=40, total=100)
+            title: str = issue["title"]
+            body: str = trim_comment(issue["body"], MAX_BODY_CHARS)
+            author: str = issue["author"]
 
-            comments_sorted = sorted(
-                comments,
-                key=lambda c: c.get("created_at") or "",
-            )
-            last_comments = comments_sorted[-comments_limit:] if comments_sorted else []
+            await maybe_progress(ctx, 40, started)
+
+            # fetch_comments уже отдаёт последние N в хронологическом порядке
+            last_comments = comments
 
             last_comment_body = ""
             last_comment_author = ""
             comments_block_lines: List[str] = []
 
             for c in last_comments:
-                c_author = (c.get("user") or {}).get("login") or "unknown"
-                c_body = c.get("body") or ""
+                c_author = c["author"]
+                # длинные логи в комментариях не должны раздувать промпт
+                c_body = trim_comment(c["body"])
                 comments_block_lines.append(f"[{c_author}]: {c_body}")
 
             if last_comments:
                 last = last_comments[-1]
-                last_comment_body = last.get("body") or ""
-                last_comment_author = (last.get("user") or {}).get("login") or "unknown"
-
-            comments_block = "\n".join(comments_block_lines)
-
-            # 3) Формируем промпт для модели
-            prompt_text = (
-                "Ты — AI-помощник службы технической поддержки.\n"
-                "У тебя есть тикет (заголовок, описание) и последние комментарии.\n"
-                "Нужно сформулировать ответ на последнее сообщение пользователя.\n\n"
-                "Требования к ответу:\n"
-                "- пиши по-русски, дружелюбно, но по делу;\n"
-                "- если не хватает информации — задай уточняющие вопросы;\n"
-                "- предложи конкретные шаги (что проверить, где посмотреть лог, и т.п.);\n"
-                "- не пиши лишней воды.\n\n"
-                f"Автор тикета: {author}\n"
-                f"Заголовок тикета: {title}\n\n"
-                f"Описание тикета:\n{body}\n\n"
-                "Последние комментарии в тикете:\n"
-                f"{comments_block}\n\n"
-                "Последнее сообщение пользователя, на которое нужно ответить:\n"
-                f"[{last_comment_author}]: {last_comment_body}\n\n"
-                "=== ОТВЕТ ДЛЯ ПОЛЬЗОВАТЕЛЯ ==="
+                last_comment_body = trim_comment(last["body"])
+                last_comment_author = last["author"]
+
+            # 3) Формируем промпт для модели. Блок комментариев — единственная
+            #    переменная часть: при нехватке места режем его с начала,
+            #    последнее сообщение пользователя остаётся в фиксированной части
+            prompt_head = "\n".join(
+                [
+                    "Ты — AI-помощник службы технической поддержки.",
+                    "У тебя есть тикет (заголовок, описание) и последние комментарии.",
+                    "Нужно сформулировать ответ на последнее сообщение пользователя.",
+                    "",
+                    "Требования к ответу:",
+                    "- пиши по-русски, дружелюбно, но по делу;",
+                    "- если не хватает информации — задай уточняющие вопросы;",
+                    "- предложи конкретные шаги (что проверить, где посмотреть лог, и т.п.);",
+                    "- не пиши лишней воды.",
+                    "",
+                    f"Автор тикета: {author}",
+                    f"Заголовок тикета: {title}",
+                    "",
+                    "Описание тикета:",
+                    body,
+                    "",
+                    "Последние комментарии в тикете:",
+                    "",
+                ]
+            )
+            prompt_tail = "\n".join(
+                [
+                    "",
+                    "Последнее сообщение пользователя, на которое нужно ответить:",
+                    f"[{last_comment_author}]: {last_comment_body}",
+                    "",
+                    "=== ОТВЕТ ДЛЯ ПОЛЬЗОВАТЕЛЯ ===",
+                ]
+            )
+            comments_block = "".join(f"{line}\n" for line in comments_block_lines)
+
+            prompt_text = budget_prompt(
+                prompt_head, prompt_tail, comments_block, max_chars=MAX_PROMPT_CHARS
             )
 
-            await ctx.report_progress(progress=70, total=100)
+            await maybe_progress(ctx, 70, started)
 
             ai_answer = await ctx.prompt(prompt_text)
             answer_text = ai_answer if isinstance(ai_answer, str) else str(ai_answer)
@@ -179,7 +207,7 @@ async def answer_ticket_question(
                 f"Сформирован и опубликован ответ AI для тикета #{issue_number}."
             )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=human)],
                 structured_content={
                     "issue_number": issue_number,
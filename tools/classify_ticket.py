@@ -1,13 +1,14 @@
-import os
 from typing import Dict, Any
 
-import httpx
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import ToolResult, github_config, log_info, tool_span
+from ._gh_cache import fetch_issue
+from ._http import get_client
 
 tracer = trace.get_tracer(__name__)
 
@@ -23,35 +24,20 @@ async def classify_ticket(
     - приоритет: low / medium / high / urgent
     """
 
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("classify_ticket") as span:
-        span.set_attribute("issue_number", issue_number)
-
-        await ctx.info(f"🤖 Анализируем тикет #{issue_number} для классификации")
+    with tool_span(tracer, "classify_ticket", issue_number=issue_number):
+        await log_info(ctx, f"🤖 Анализируем тикет #{issue_number} для классификации")
 
         try:
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
-
-            span.set_attribute("github_repo", repo)
-
-            headers = {"Accept": "application/vnd.github+json"}
-            if token:
-                headers["Authorization"] = {f"Bearer {token}"}
+            repo, token, headers = github_config()
 
             # 1. Забираем сам тикет
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                issue_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-                resp_issue = await client.get(issue_url, headers=headers)
-                resp_issue.raise_for_status()
-                issue = resp_issue.json()
+            issue = await fetch_issue(get_client(), repo, issue_number, headers)
 
-            title = issue.get("title", "")
-            body = issue.get("body", "")
+            title = issue["title"]
+            body = issue["body"]
 
             # 2. Забираем последний комментарий
             from .get_ticket_last_comment import get_ticket_last_comment
@@ -90,7 +76,7 @@ async def classify_ticket(
                 ctx=ctx,
             )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[
                     TextContent(
                         type="text",
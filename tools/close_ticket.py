@@ -1,16 +1,27 @@
 """Инструмент для аккуратного закрытия тикета в GitHub."""
 
-import os
-from typing import Any, Dict, List, Optional
+import time
+from typing import List, Optional
 
 import httpx
+import orjson
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import (
+    ToolResult,
+    fire_and_forget,
+    github_config,
+    log_info,
+    maybe_progress,
+    tool_span,
+)
+from ._gh_cache import issues_path, remember_issue
+from ._http import get_client, github_request
 from .post_ticket_reply import post_ticket_reply
 
 tracer = trace.get_tracer(__name__)
@@ -40,20 +51,16 @@ async def close_ticket(
     - добавляет resolution label;
     - переводит state=closed.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("close_ticket") as span:
-        span.set_attribute("issue_number", issue_number)
-
+    with tool_span(tracer, "close_ticket", issue_number=issue_number):
         try:
-            await ctx.info(f"✅ Закрываем тикет #{issue_number}")
+            started = time.monotonic()
+            fire_and_forget(log_info(ctx, f"✅ Закрываем тикет #{issue_number}"))
             await ctx.report_progress(progress=0, total=100)
 
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
+            repo, token, headers = github_config()
 
             if not token:
                 msg = "Для закрытия тикета требуется GITHUB_TOKEN с правами записи."
@@ -65,66 +72,63 @@ async def close_ticket(
                     )
                 )
 
-            span.set_attribute("github_repo", repo)
-
-            base_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-            headers: Dict[str, str] = {
-                "Accept": "application/vnd.github+json",
-                "Authorization": f"Bearer {token}",
-            }
-
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                # 1) Получаем текущий issue, чтобы не потерять labels
-                resp_issue = await client.get(base_url, headers=headers)
-                resp_issue.raise_for_status()
-                issue: Dict[str, Any] = resp_issue.json()
-
-                current_labels: List[str] = [
-                    l.get("name", "") for l in issue.get("labels", [])
-                ]
-
-                # 2) Добавляем финальный комментарий (если есть)
-                if final_comment:
-                    await ctx.info("📝 Оставляем финальный комментарий")
-                    await post_ticket_reply(
-                        issue_number=issue_number,
-                        reply_text=final_comment,
-                        ctx=ctx,
-                    )
-
-                await ctx.report_progress(progress=50, total=100)
+            base_url = f"{issues_path(repo)}/{issue_number}"
+            client = get_client()
 
-                new_labels = list(current_labels)
-                if resolution_label and resolution_label not in new_labels:
-                    new_labels.append(resolution_label)
+            # 1) Добавляем финальный комментарий (если есть)
+            if final_comment:
+                fire_and_forget(log_info(ctx, "📝 Оставляем финальный комментарий"))
+                await post_ticket_reply(
+                    issue_number=issue_number,
+                    reply_text=final_comment,
+                    ctx=ctx,
+                )
 
-                payload: Dict[str, Any] = {
-                    "state": "closed",
-                    "labels": new_labels,
-                }
+            await maybe_progress(ctx, 50, started)
 
-                await ctx.info("📡 Отправляем PATCH для закрытия тикета")
-                resp_update = await client.patch(
-                    base_url,
+            # 2) resolution label добавляем отдельным endpoint'ом — он не трогает
+            #    остальные метки, поэтому текущий набор запрашивать не нужно
+            if resolution_label:
+                resp_labels = await github_request(
+                    client,
+                    "POST",
+                    f"{base_url}/labels",
                     headers=headers,
-                    json=payload,
+                    json={"labels": [resolution_label]},
                 )
-                resp_update.raise_for_status()
-                updated: Dict[str, Any] = resp_update.json()
+                resp_labels.raise_for_status()
+
+            # 3) Закрываем тикет
+            fire_and_forget(log_info(ctx, "📡 Отправляем PATCH для закрытия тикета"))
+            resp_update = await github_request(
+                client,
+                "PATCH",
+                base_url,
+                headers=headers,
+                json={"state": "closed"},
+            )
+            resp_update.raise_for_status()
+
+            # в кэш — актуальное состояние и метки из ответа на PATCH;
+            # оттуда же берём метки для ответа
+            updated = remember_issue(
+                repo, issue_number, orjson.loads(resp_update.content)
+            )
+            final_labels: List[str] = updated["labels"]
 
             await ctx.report_progress(progress=100, total=100)
 
             text = (
                 f"Тикет #{issue_number} закрыт.\n"
-                f"Labels: {', '.join([l.get('name', '') for l in updated.get('labels', [])])}"
+                f"Labels: {', '.join(final_labels)}"
             )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={
                     "issue_number": issue_number,
-                    "state": updated.get("state"),
-                    "labels": [l.get("name", "") for l in updated.get("labels", [])],
+                    "state": updated["state"],
+                    "labels": final_labels,
                 },
                 meta={"repo": repo},
             )
@@ -1,22 +1,155 @@
 """Инструмент для разбиения тикета на подзадачи (sub-issues) в GitHub."""
 
-import json
-import os
-from typing import Any, Dict, List, Optional
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import httpx
+import orjson
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import (
+    ToolResult,
+    fire_and_forget,
+    github_config,
+    log_info,
+    maybe_progress,
+    tool_span,
+    wants_progress,
+)
+from ._gh_cache import ensure_labels, fetch_comments, fetch_issue, issues_path
+from ._http import get_client, github_request, graphql
 from .post_ticket_reply import post_ticket_reply
 
 tracer = trace.get_tracer(__name__)
 
 
+def _build_payload(
+    st: Dict[str, Any], issue_number: int, parent_url: str
+) -> Dict[str, Any]:
+    """Тело POST /issues для одной подзадачи (со ссылкой на родителя в body)."""
+    st_title: str = st.get("title") or "Подзадача без названия"
+    st_body: str = st.get("body") or ""
+    # повторы одной метки GitHub не нужны
+    st_labels: List[str] = list(dict.fromkeys(st.get("labels") or []))
+
+    full_body = (
+        f"{st_body}\n\n"
+        f"---\n"
+        f"Родительский тикет: #{issue_number} ({parent_url})"
+    )
+
+    payload: Dict[str, Any] = {
+        "title": st_title,
+        "body": full_body,
+    }
+    if st_labels:
+        payload["labels"] = st_labels
+    return payload
+
+
+_CREATED_FIELDS = "issue { number title url labels(first: 20) { nodes { name } } }"
+
+
+def _build_mutation(
+    payloads: List[Dict[str, Any]], repo_id: str, label_ids: Dict[str, str]
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Одна GraphQL-мутация с createIssue на каждую подзадачу (алиасы m0, m1, ...).
+    """
+    params = ["$repo: ID!"]
+    fields = []
+    variables: Dict[str, Any] = {"repo": repo_id}
+    for i, payload in enumerate(payloads):
+        params += [f"$t{i}: String!", f"$b{i}: String", f"$l{i}: [ID!]"]
+        fields.append(
+            f"m{i}: createIssue(input: {{repositoryId: $repo, title: $t{i}, "
+            f"body: $b{i}, labelIds: $l{i}}}) {{ {_CREATED_FIELDS} }}"
+        )
+        variables[f"t{i}"] = payload["title"]
+        variables[f"b{i}"] = payload["body"]
+        variables[f"l{i}"] = [label_ids[name] for name in payload.get("labels", [])]
+    return f"mutation({', '.join(params)}) {{ {' '.join(fields)} }}", variables
+
+
+async def _create_via_graphql(
+    client: httpx.AsyncClient,
+    headers: Dict[str, str],
+    payloads: List[Dict[str, Any]],
+    repo_id: str,
+    label_ids: Dict[str, str],
+) -> List[Union[Dict[str, Any], str]]:
+    """
+    Создаёт подзадачи одним GraphQL-запросом.
+
+    На каждую подзадачу — dict созданного issue или текст ошибки.
+    """
+    if not payloads:
+        return []
+
+    resp = await graphql(
+        client, headers, *_build_mutation(payloads, repo_id, label_ids)
+    )
+    data = resp.get("data") or {}
+    errors = {
+        e["path"][0]: e.get("message")
+        for e in resp.get("errors") or []
+        if e.get("path")
+    }
+
+    results: List[Union[Dict[str, Any], str]] = []
+    for i in range(len(payloads)):
+        node = data.get(f"m{i}")
+        if node is None:
+            results.append(errors.get(f"m{i}") or "ошибка GraphQL")
+            continue
+        issue = node["issue"]
+        results.append(
+            {
+                "number": issue["number"],
+                "title": issue["title"],
+                "url": issue["url"],
+                "labels": [l["name"] for l in issue["labels"]["nodes"]],
+            }
+        )
+    return results
+
+
+async def _create_via_rest(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: Dict[str, str],
+    payload: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Создаёт одну подзадачу через REST (POST /issues)."""
+    resp = await github_request(client, "POST", url, headers=headers, json=payload)
+    resp.raise_for_status()
+
+    # из ответа нужны 4 поля — orjson разбирает bytes быстрее .json()
+    child_issue: Dict[str, Any] = orjson.loads(resp.content)
+    return {
+        "number": child_issue.get("number"),
+        "title": child_issue.get("title"),
+        "url": child_issue.get("html_url"),
+        "labels": [l["name"] for l in child_issue.get("labels") or ()],
+    }
+
+
+def _extract_json(text: str) -> Any:
+    """JSON из ответа модели; обёртка ```json ... ``` снимается."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("```", 2)[1]
+        if text[:4].lower() == "json":
+            text = text[4:]
+    return orjson.loads(text)
+
+
 @mcp.tool()
 async def create_subtasks_from_ticket(
     issue_number: int = Field(
@@ -45,25 +178,31 @@ async def create_subtasks_from_ticket(
     3) Если dry_run=False — создаём подзадачи как отдельные issues в GitHub,
        помечаем их ссылкой на родителя и оставляем комментарий в родителе.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("create_subtasks_from_ticket") as span:
-        span.set_attribute("issue_number", issue_number)
-        span.set_attribute("max_subtasks", max_subtasks)
-        span.set_attribute("dry_run", dry_run)
-
+    with tool_span(
+        tracer,
+        "create_subtasks_from_ticket",
+        issue_number=issue_number,
+        max_subtasks=max_subtasks,
+        dry_run=dry_run,
+    ):
         try:
-            await ctx.info(
-                f"🧩 Разбиваем тикет #{issue_number} на подзадачи (dry_run={dry_run})"
+            started = time.monotonic()
+            fire_and_forget(
+                log_info(
+                    ctx,
+                    f"🧩 Разбиваем тикет #{issue_number} на подзадачи (dry_run={dry_run})"
+                )
             )
-            await ctx.report_progress(progress=0, total=100)
+            # промежуточный прогресс шлём, только если клиент его запросил
+            track = wants_progress(ctx)
+            if track:
+                await ctx.report_progress(progress=0, total=100)
 
             # 1) Настройки GitHub
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
+            repo, token, headers = github_config()
             if not token and not dry_run:
                 msg = (
                     "Для создания подзадач требуется GITHUB_TOKEN с правами записи. "
@@ -77,50 +216,35 @@ async def create_subtasks_from_ticket(
                     )
                 )
 
-            span.set_attribute("github_repo", repo)
+            client = get_client()
 
-            base_issue_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-            headers: Dict[str, str] = {
-                "Accept": "application/vnd.github+json",
-            }
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
-
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                # 2) Забираем родительский тикет
-                resp_issue = await client.get(base_issue_url, headers=headers)
-                resp_issue.raise_for_status()
-                issue: Dict[str, Any] = resp_issue.json()
-
-                if "pull_request" in issue:
-                    msg = "Указан номер pull request, а не обычного issue."
-                    await ctx.error(msg)
-                    raise McpError(
-                        ErrorData(
-                            code=-32602,
-                            message=msg,
-                        )
-                    )
-
-                title: str = issue.get("title") or ""
-                body: str = issue.get("body") or ""
-                parent_url: str = issue.get("html_url") or ""
+            # 2) Родительский тикет и его последние комментарии (для контекста)
+            #    друг от друга не зависят — запрашиваем параллельно
+            issue, comments = await asyncio.gather(
+                fetch_issue(client, repo, issue_number, headers),
+                fetch_comments(client, repo, issue_number, headers, 5),
+            )
 
-                # 3) Берём несколько последних комментариев (для контекста)
-                comments_url = f"{base_issue_url}/comments"
-                resp_comments = await client.get(
-                    comments_url, headers=headers, params={"per_page": 10}
+            if issue["is_pr"]:
+                msg = "Указан номер pull request, а не обычного issue."
+                await ctx.error(msg)
+                raise McpError(
+                    ErrorData(
+                        code=-32602,
+                        message=msg,
+                    )
                 )
-                resp_comments.raise_for_status()
-                comments: List[Dict[str, Any]] = resp_comments.json()
 
-            await ctx.report_progress(progress=30, total=100)
+            title: str = issue["title"]
+            body: str = issue["body"]
+            parent_url: str = issue["html_url"]
+
+            if track:
+                await maybe_progress(ctx, 30, started)
 
             comments_text_parts: List[str] = []
-            for c in comments[-5:]:
-                author = (c.get("user") or {}).get("login") or "unknown"
-                text = c.get("body") or ""
-                comments_text_parts.append(f"[{author}]: {text}")
+            for c in comments:
+                comments_text_parts.append(f"[{c['author']}]: {c['body']}")
 
             comments_block = "\n".join(comments_text_parts)
 
@@ -148,14 +272,17 @@ async def create_subtasks_from_ticket(
                 "=== КОНЕЦ ===\n"
             )
 
-            await ctx.report_progress(progress=50, total=100)
+            if track:
+                await maybe_progress(ctx, 50, started)
 
             ai_raw = await ctx.prompt(prompt_text)
             ai_text = ai_raw if isinstance(ai_raw, str) else str(ai_raw)
 
             try:
-                parsed = json.loads(ai_text)
-            except Exception:
+                parsed = _extract_json(ai_text)
+            except orjson.JSONDecodeError:
+                parsed = {}
+            if not isinstance(parsed, dict):
                 parsed = {}
 
             subtasks: List[Dict[str, Any]] = parsed.get("subtasks") or []
@@ -169,7 +296,7 @@ async def create_subtasks_from_ticket(
                 text = (
                     "Модель не смогла предложить подзадачи или ответ не распознан как JSON."
                 )
-                return ToolResult(
+                return ToolResult.model_construct(
                     content=[TextContent(type="text", text=text)],
                     structured_content={
                         "issue_number": issue_number,
@@ -179,48 +306,69 @@ async def create_subtasks_from_ticket(
                     meta={"repo": repo},
                 )
 
-            await ctx.info(f"🧩 Модель предложила подзадач: {len(subtasks)}")
-            await ctx.report_progress(progress=70, total=100)
+            fire_and_forget(
+                log_info(ctx, f"🧩 Модель предложила подзадач: {len(subtasks)}")
+            )
+            if track:
+                await maybe_progress(ctx, 70, started)
 
             created: List[Dict[str, Any]] = []
 
             if not dry_run:
-                # 5) Создаём подзадачи как отдельные issues
-                async with httpx.AsyncClient(timeout=20.0) as client:
-                    for st in subtasks:
-                        st_title: str = st.get("title") or "Подзадача без названия"
-                        st_body: str = st.get("body") or ""
-                        st_labels: List[str] = st.get("labels") or []
-
-                        # Добавим ссылку на родителя в body
-                        full_body = (
-                            f"{st_body}\n\n"
-                            f"---\n"
-                            f"Родительский тикет: #{issue_number} ({parent_url})"
-                        )
-
-                        payload: Dict[str, Any] = {
-                            "title": st_title,
-                            "body": full_body,
-                        }
-                        if st_labels:
-                            payload["labels"] = st_labels
-
-                        create_url = f"https://api.github.com/repos/{repo}/issues"
-                        resp_create = await client.post(
-                            create_url, headers=headers, json=payload
-                        )
-                        resp_create.raise_for_status()
-                        child_issue: Dict[str, Any] = resp_create.json()
-
-                        created.append(
-                            {
-                                "number": child_issue.get("number"),
-                                "title": child_issue.get("title"),
-                                "url": child_issue.get("html_url"),
-                                "labels": [l.get("name", "") for l in child_issue.get("labels", [])],
-                            }
-                        )
+                # 5) Создаём подзадачи как отдельные issues. GraphQL createIssue
+                #    принимает node ID меток, а не имена, поэтому недостающие
+                #    в репозитории метки сначала заводим — по разу на всю пачку.
+                #    Подзадачи с метками, которые завести не удалось, идут
+                #    через REST (он создаёт метки сам).
+                payloads = [_build_payload(st, issue_number, parent_url) for st in subtasks]
+                meta = await ensure_labels(
+                    client,
+                    repo,
+                    headers,
+                    (name for payload in payloads for name in payload.get("labels", [])),
+                )
+                label_ids: Dict[str, str] = meta["labels"]
+                via_graphql = [
+                    i
+                    for i, payload in enumerate(payloads)
+                    if all(name in label_ids for name in payload.get("labels", []))
+                ]
+                via_rest = [i for i in range(len(payloads)) if i not in via_graphql]
+
+                create_url = issues_path(repo)
+                gql_results, *rest_results = await asyncio.gather(
+                    _create_via_graphql(
+                        client,
+                        headers,
+                        [payloads[i] for i in via_graphql],
+                        meta["id"],
+                        label_ids,
+                    ),
+                    *(
+                        _create_via_rest(client, create_url, headers, payloads[i])
+                        for i in via_rest
+                    ),
+                    return_exceptions=True,
+                )
+                if isinstance(gql_results, BaseException):
+                    # мутация не прошла целиком — ошибка у каждой её подзадачи
+                    gql_results = [gql_results] * len(via_graphql)
+
+                outcomes: Dict[int, Any] = dict(zip(via_graphql, gql_results))
+                outcomes.update(zip(via_rest, rest_results))
+
+                for i, st in enumerate(subtasks):
+                    outcome = outcomes[i]
+                    if isinstance(outcome, dict):
+                        created.append(outcome)
+                        continue
+                    if isinstance(outcome, BaseException) and not isinstance(
+                        outcome, httpx.HTTPError
+                    ):
+                        raise outcome
+                    await ctx.error(
+                        f"❌ Не удалось создать подзадачу «{st.get('title')}»: {outcome}"
+                    )
 
                 # 6) Комментарий в родительском тикете с ссылками на подзадачи
                 if created:
@@ -257,7 +405,7 @@ async def create_subtasks_from_ticket(
                     "(возможно, ошибка при обращении к GitHub API)."
                 )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=human_text)],
                 structured_content={
                     "issue_number": issue_number,
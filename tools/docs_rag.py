@@ -1,17 +1,32 @@
 """Инструменты для работы с локальной документацией (простейший RAG)."""
 
+import asyncio
+import heapq
+import mmap
 import os
 import re
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult
+from .utils import ToolResult, log_info, tool_span
+
+try:  # Aho-Corasick ускоряет поиск слов запроса по словарю индекса
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 tracer = trace.get_tracer(__name__)
 
@@ -26,89 +41,313 @@ def _get_docs_dir() -> Path:
     По умолчанию: ./docs
     Можно переопределить через переменную окружения DOCS_DIR.
     """
-    docs_dir = os.getenv("DOCS_DIR", "docs")
+    return _resolve_docs_dir(os.getenv("DOCS_DIR", "docs"))
+
+
+@lru_cache(maxsize=8)
+def _resolve_docs_dir(docs_dir: str) -> Path:
+    # resolve() ходит в файловую систему — делаем его один раз на значение DOCS_DIR
     return Path(docs_dir).resolve()
 
 
+# Регулярки компилируем один раз при импорте
+_PARA_RE = re.compile(r"\n\s*\n")  # абзацы разделены пустыми строками
+# То же для байтов UTF-8 (mmap). В bytes-регулярке \s — только ASCII-пробелы,
+# поэтому юникодные пробелы из str-версии \s (NBSP, U+2028 и т.д.) выписаны
+# явно: абзацы должны делиться одинаково независимо от размера файла
+_UNICODE_SPACE_BYTES = (
+    rb"(?:[\t\n\x0b\x0c\r\x1c-\x1f ]"
+    rb"|\xc2[\x85\xa0]"  # U+0085, U+00A0
+    rb"|\xe1\x9a\x80"  # U+1680
+    rb"|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]"  # U+2000..U+200A, U+2028, U+2029, U+202F
+    rb"|\xe2\x81\x9f"  # U+205F
+    rb"|\xe3\x80\x80)"  # U+3000
+)
+_PARA_RE_BYTES = re.compile(rb"\n" + _UNICODE_SPACE_BYTES + rb"*\n")
+_TOKEN_RE = re.compile(r"\w+")
+
+# Файлы от этого размера читаются через mmap: в памяти не держим их целиком
+# ни как bytes, ни как str, а декодируем по одному абзацу
+MMAP_THRESHOLD = 1024 * 1024
+
+# Длина фрагмента абзаца в результатах поиска
+SNIPPET_CHARS = 600
+
+# Список файлов перечитываем не чаще раза в FILES_TTL секунд, а индекс
+# файла — только когда у него поменялся mtime.
+FILES_TTL = 30.0
+
+
+class _FileIndex(NamedTuple):
+    """Индекс одного файла."""
+
+    mtime: float
+    # фрагменты абзацев (уже обрезанные до SNIPPET_CHARS) — полный текст не храним
+    snippets: List[str]
+    # слово (lower) -> [(para_idx, сколько раз слово в абзаце)]
+    postings: Dict[str, List[Tuple[int, int]]]
+
+
+_EMPTY_FILE = _FileIndex(-1.0, [], {})
+
+_FILES_CACHE: Optional[Tuple[float, Path, List[Path]]] = None  # (истекает, base, файлы)
+_DOC_CACHE: Dict[Path, _FileIndex] = {}
+# Инструменты вызывают _iter_doc_files/_get_index из рабочих потоков
+# (asyncio.to_thread): перестраиваем список файлов и индекс под блокировкой,
+# чтобы одновременные вызовы не делали одну и ту же работу и не мешали друг другу
+_FILES_LOCK = threading.Lock()
+_INDEX_LOCK = threading.Lock()
+
+
 def _iter_doc_files() -> List[Path]:
     """
     Возвращает список файлов документации (md, rst, txt) в каталоге docs.
     """
+    global _FILES_CACHE
+
     base = _get_docs_dir()
-    if not base.exists() or not base.is_dir():
-        return []
+    if (files := _cached_doc_files(base)) is not None:
+        return files
+
+    with _FILES_LOCK:
+        # пока ждали блокировку, соседний поток мог уже обновить список
+        if (files := _cached_doc_files(base)) is not None:
+            return files
+
+        if not base.is_dir():  # is_dir() == False и для несуществующего пути
+            files = []
+        else:
+            exts = {".md", ".rst", ".txt"}
+            files = [
+                path
+                for path in base.rglob("*")
+                if path.is_file() and path.suffix.lower() in exts
+            ]
 
-    exts = {".md", ".rst", ".txt"}
-    files: List[Path] = []
-    files.extend(
-        path
-        for path in base.rglob("*")
-        if path.is_file() and path.suffix.lower() in exts
-    )
-    return files
+        # удалённые файлы больше не держим в памяти
+        for stale in _DOC_CACHE.keys() - set(files):
+            _DOC_CACHE.pop(stale, None)
 
+        _FILES_CACHE = (time.monotonic() + FILES_TTL, base, files)
+        return files
+
+
+def _cached_doc_files(base: Path) -> Optional[List[Path]]:
+    """Список файлов из _FILES_CACHE, если он для base и ещё не истёк."""
+    if _FILES_CACHE is None:
+        return None
+    expires, cached_base, cached_files = _FILES_CACHE
+    if cached_base == base and time.monotonic() < expires:
+        return cached_files
+    return None
 
-def _simple_score(text: str, query: str) -> int:
-    """
-    Простейший скоринг: считаем вхождения слов запроса в тексте.
-    """
-    text_lower = text.lower()
-    tokens = re.findall(r"\w+", query.lower())
-    return sum(text_lower.count(tok) for tok in tokens if tok)
 
+def _iter_paragraphs(path: Path) -> Iterator[str]:
+    """Абзацы файла (пустые строки как разделители), включая пустые."""
+    with path.open("rb") as fh:
+        if os.fstat(fh.fileno()).st_size < MMAP_THRESHOLD:
+            content = fh.read().decode("utf-8", errors="ignore")
+            yield from _PARA_RE.split(content)
+            return
 
-def _search_in_file(path: Path, query: str, max_snippets: int = 3) -> List[Dict[str, Any]]:
+        # "\n" в UTF-8 не встречается внутри многобайтовых символов,
+        # поэтому абзацы можно резать по байтам и декодировать по отдельности
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            for m in _PARA_RE_BYTES.finditer(mm):
+                yield mm[start : m.start()].decode("utf-8", errors="ignore")
+                start = m.end()
+            yield mm[start:].decode("utf-8", errors="ignore")
+
+
+def _index_file(path: Path, mtime: float) -> _FileIndex:
     """
-    Ищем совпадения в одном файле, возвращаем сниппеты.
+    Индекс файла: фрагменты непустых абзацев и постинги слов.
+
+    Файл перечитывается, только если изменился его mtime.
     """
+    cached = _DOC_CACHE.get(path)
+    if cached is not None and cached.mtime == mtime:
+        return cached
+
+    snippets: List[str] = []
+    postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
     try:
-        content = path.read_text(encoding="utf-8", errors="ignore")
-    except OSError:
-        return []
+        for para in _iter_paragraphs(path):
+            para = para.strip()
+            if not para:
+                continue
+            para_idx = len(snippets)
+            if len(para) > SNIPPET_CHARS:
+                snippets.append(f"{para[:SNIPPET_CHARS]}...")
+            else:
+                snippets.append(para)
+            for word, tf in Counter(_TOKEN_RE.findall(para.lower())).items():
+                postings[word].append((para_idx, tf))
+    except (OSError, ValueError):
+        return _EMPTY_FILE
 
-    # Разобьём по "абзацам" (пустые строки как разделители)
-    raw_paragraphs = re.split(r"\n\s*\n", content)
-    snippets: List[Dict[str, Any]] = []
+    entry = _FileIndex(mtime, snippets, dict(postings))
+    _DOC_CACHE[path] = entry
+    return entry
 
-    for para in raw_paragraphs:
-        para_stripped = para.strip()
-        if not para_stripped:
-            continue
 
-        score = _simple_score(para_stripped, query)
-        if score <= 0:
-            continue
+class _DocIndex(NamedTuple):
+    """Инвертированный индекс по абзацам всех файлов документации."""
 
-        # Ограничим размер фрагмента
-        if len(para_stripped) > 600:
-            para_stripped = f"{para_stripped[:600]}..."
+    # (path, mtime) всех файлов — по нему понимаем, что индекс устарел
+    signature: Tuple[Tuple[Path, float], ...]
+    files: List[Path]
+    snippets: List[List[str]]
+    # слово (lower) -> [(file_idx, para_idx, сколько раз слово в абзаце)]
+    postings: Dict[str, List[Tuple[int, int, int]]]
+    # словарь одной строкой через "\n" и начала слов в ней — для Aho-Corasick
+    vocab: List[str]
+    vocab_text: str
+    vocab_starts: List[int]
 
-        snippets.append(
-            {
-                "file": str(path),
-                "score": score,
-                "snippet": para_stripped,
-            }
+
+_INDEX: Optional[_DocIndex] = None
+
+
+def _get_index() -> _DocIndex:
+    """Индекс по текущим файлам; перестраивается, если набор файлов или mtime изменились."""
+    global _INDEX
+
+    files = _iter_doc_files()
+    signature: List[Tuple[Path, float]] = []
+    for path in files:
+        try:
+            signature.append((path, path.stat().st_mtime))
+        except OSError:
+            signature.append((path, -1.0))
+
+    if _INDEX is not None and _INDEX.signature == tuple(signature):
+        return _INDEX
+
+    with _INDEX_LOCK:
+        # пока ждали блокировку, соседний поток мог уже перестроить индекс
+        if _INDEX is not None and _INDEX.signature == tuple(signature):
+            return _INDEX
+
+        # Чтение файлов — блокирующий I/O, читаем их параллельно
+        def load(item: Tuple[Path, float]) -> _FileIndex:
+            path, mtime = item
+            return _index_file(path, mtime) if mtime >= 0 else _EMPTY_FILE
+
+        with ThreadPoolExecutor(max_workers=min(8, len(files) or 1)) as pool:
+            entries: List[_FileIndex] = list(pool.map(load, signature))
+
+        postings: Dict[str, List[Tuple[int, int, int]]] = defaultdict(list)
+        for file_idx, entry in enumerate(entries):
+            for word, hits in entry.postings.items():
+                postings[word].extend(
+                    (file_idx, para_idx, tf) for para_idx, tf in hits
+                )
+
+        vocab = list(postings)
+        vocab_starts: List[int] = []
+        offset = 0
+        for word in vocab:
+            vocab_starts.append(offset)
+            offset += len(word) + 1
+
+        _INDEX = _DocIndex(
+            tuple(signature),
+            files,
+            [entry.snippets for entry in entries],
+            dict(postings),
+            vocab,
+            "\n".join(vocab),
+            vocab_starts,
         )
+        return _INDEX
+
 
-    # Отсортируем фрагменты по релевантности
-    snippets.sort(key=lambda x: x["score"], reverse=True)
-    return snippets[:max_snippets]
+@lru_cache(maxsize=256)
+def _token_automaton(tokens: Tuple[str, ...]) -> "ahocorasick.Automaton":
+    automaton = ahocorasick.Automaton()
+    for tok in tokens:
+        automaton.add_word(tok, tok)
+    automaton.make_automaton()
+    return automaton
 
 
-def _search_docs_internal(query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+def _matching_words(index: _DocIndex, tokens: List[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Пары (слово словаря, слово запроса), где слово запроса — подстрока слова.
+
+    С pyahocorasick словарь проходится один раз для всех слов запроса,
+    без него — отдельный проход на каждое слово.
+    """
+    if not tokens:
+        return
+
+    if ahocorasick is None:
+        for tok in tokens:
+            for word in index.vocab:
+                if tok in word:
+                    yield word, tok
+        return
+
+    seen = set()
+    automaton = _token_automaton(tuple(sorted(tokens)))
+    for end, tok in automaton.iter(index.vocab_text):
+        word_idx = bisect_right(index.vocab_starts, end) - 1
+        if (word_idx, tok) not in seen:
+            seen.add((word_idx, tok))
+            yield index.vocab[word_idx], tok
+
+
+async def _search_docs_internal(
+    query: str, max_results: int = 10
+) -> List[Dict[str, Any]]:
     """
     Внутренняя функция поиска по всем документам.
+
+    Обход каталога, stat/чтение файлов и скоринг выполняются в отдельном
+    потоке, чтобы не блокировать event loop.
     """
-    files = _iter_doc_files()
-    all_snippets: List[Dict[str, Any]] = []
+    return await asyncio.to_thread(_search_index, query, max_results)
+
 
-    for f in files:
-        snippets = _search_in_file(f, query, max_snippets=3)
-        all_snippets.extend(snippets)
+def _search_index(query: str, max_results: int) -> List[Dict[str, Any]]:
+    """
+    Поиск по индексу документации (синхронно).
 
-    all_snippets.sort(key=lambda x: x["score"], reverse=True)
-    return all_snippets[:max_results]
+    Скоринг — число вхождений слов запроса в абзаце (как подстрок, без учёта
+    регистра). Слово запроса целиком лежит внутри одного слова текста, поэтому
+    вхождения считаются по словарю индекса, а не проходом по всем абзацам.
+    Из каждого файла берём не больше 3 лучших абзацев.
+    """
+    index = _get_index()
+    tokens = Counter(_TOKEN_RE.findall(query.lower()))
+
+    scores: Counter = Counter()
+    for word, tok in _matching_words(index, list(tokens)):
+        # str.count — без перекрытий, как и в исходном скоринге
+        weight = tokens[tok] * word.count(tok)
+        for file_idx, para_idx, tf in index.postings[word]:
+            scores[(file_idx, para_idx)] += weight * tf
+
+    # не больше 3 абзацев из файла; при равном score — порядок файлов и абзацев
+    per_file: Dict[int, List[Tuple[int, int, int]]] = defaultdict(list)
+    for (file_idx, para_idx), score in scores.items():
+        per_file[file_idx].append((-score, file_idx, para_idx))
+    candidates: List[Tuple[int, int, int]] = []
+    for entries in per_file.values():
+        candidates.extend(heapq.nsmallest(3, entries))
+
+    results: List[Dict[str, Any]] = []
+    for neg_score, file_idx, para_idx in heapq.nsmallest(max_results, candidates):
+        results.append(
+            {
+                "file": str(index.files[file_idx]),
+                "score": -neg_score,
+                "snippet": index.snippets[file_idx][para_idx],
+            }
+        )
+    return results
 
 
 # --- MCP-инструменты ---
@@ -119,15 +358,13 @@ async def list_docs(ctx: Context | None = None) -> ToolResult:
     """
     📚 Список доступных файлов документации.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("list_docs"):
+    with tool_span(tracer, "list_docs"):
         try:
             docs_dir = _get_docs_dir()
-            files = _iter_doc_files()
+            files = await asyncio.to_thread(_iter_doc_files)
 
             if not files:
                 text = (
@@ -140,7 +377,7 @@ async def list_docs(ctx: Context | None = None) -> ToolResult:
                 lines.extend(f"- {r}" for r in rels)
                 text = "\n".join(lines)
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={
                     "docs_dir": str(docs_dir),
@@ -176,20 +413,18 @@ async def search_docs(
     """
     🔎 Поиск по локальной документации (простой full-text).
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("search_docs") as span:
-        span.set_attribute("query", query)
-        span.set_attribute("max_results", max_results)
+    with tool_span(tracer, "search_docs", query=query, max_results=max_results):
 
         try:
-            await ctx.info(f"🔎 Ищем по документации: {query!r}")
+            await log_info(ctx, f"🔎 Ищем по документации: {query!r}")
             await ctx.report_progress(progress=0, total=100)
 
-            snippets = _search_docs_internal(query=query, max_results=max_results)
+            snippets = await _search_docs_internal(
+                query=query, max_results=max_results
+            )
 
             if not snippets:
                 text = f"По запросу {query!r} ничего не найдено в документации."
@@ -203,7 +438,7 @@ async def search_docs(
 
             await ctx.report_progress(progress=100, total=100)
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={"results": snippets},
                 meta={"query": query},
@@ -241,20 +476,21 @@ async def answer_from_docs(
     Он подбирает релевантные фрагменты документации и возвращает их,
     а уже модель-хост (агент) формирует финальный ответ.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("answer_from_docs") as span:
-        span.set_attribute("query", query)
-        span.set_attribute("max_context_fragments", max_context_fragments)
+    with tool_span(
+        tracer,
+        "answer_from_docs",
+        query=query,
+        max_context_fragments=max_context_fragments,
+    ):
 
         try:
-            await ctx.info(f"📘 Отвечаем на вопрос по документации: {query!r}")
+            await log_info(ctx, f"📘 Отвечаем на вопрос по документации: {query!r}")
             await ctx.report_progress(progress=0, total=100)
 
-            snippets = _search_docs_internal(
+            snippets = await _search_docs_internal(
                 query=query,
                 max_results=max_context_fragments,
             )
@@ -264,7 +500,7 @@ async def answer_from_docs(
                     f"В документации не нашлось ничего по запросу {query!r}. "
                     "MCP-сервер не может ответить на основе документов."
                 )
-                return ToolResult(
+                return ToolResult.model_construct(
                     content=[TextContent(type="text", text=text)],
                     structured_content={
                         "answer": None,
@@ -289,7 +525,7 @@ async def answer_from_docs(
 
             # 'answer' здесь — это просто агрегированный текст из документации.
             # Модель-хост может на его основе сформировать нормальный ответ.
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={
                     "answer": text,
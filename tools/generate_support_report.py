@@ -1,22 +1,123 @@
 """Инструмент для генерации простого отчёта по тикетам поддержки."""
 
 import datetime
-import os
+import time
 from collections import Counter
-from typing import Any, Dict, List
+from itertools import starmap
+from typing import Any, Dict, List, Tuple
 
 import httpx
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import ToolResult, github_config, log_info, maybe_progress, tool_span
+from ._gh_cache import fetch_all_pages, fetch_repo_meta, issues_path
+from ._http import get_client, graphql
 
 tracer = trace.get_tracer(__name__)
 
 
+def _thin(issues: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Состояние и метки тикетов (lower, в порядке GitHub); PR не считаем."""
+    return [
+        {
+            "state": issue.get("state") or "open",
+            "labels": tuple(
+                l.get("name", "").lower() for l in issue.get("labels") or ()
+            ),
+        }
+        for issue in issues
+        if "pull_request" not in issue
+    ]
+
+
+_TYPES = ("bug", "feature", "question", "support")
+_TYPE_TAGS = frozenset(_TYPES)
+
+_FMT_COUNT = "- {}: {}".format
+
+# (total, open, типы, приоритеты)
+_Counts = Tuple[int, int, Counter, Counter]
+
+
+def _count_issues(issues: List[Dict[str, Any]]) -> _Counts:
+    """Считает метрики по выгруженному списку тикетов."""
+    opened = sum(issue["state"] == "open" for issue in issues)
+
+    # тип тикета по label (bug/feature/question/support); тикет с несколькими
+    # метками типа учитывается в каждой из них
+    types = Counter(
+        tag for issue in issues for tag in _TYPE_TAGS.intersection(issue["labels"])
+    )
+
+    # приоритет по label `priority: ...`
+    priorities = Counter(
+        lbl[9:].strip()
+        for issue in issues
+        for lbl in issue["labels"]
+        if lbl[:9] == "priority:"
+    )
+
+    return len(issues), opened, types, priorities
+
+
+async def _count_issues_search(
+    client: httpx.AsyncClient,
+    repo: str,
+    headers: Dict[str, str],
+    since_iso: str,
+) -> _Counts:
+    """
+    Те же метрики без выгрузки тикетов: один GraphQL-запрос, где каждый
+    счётчик — алиас search(...) { issueCount } с фильтром по метке.
+
+    Метки приоритетов берутся из меток репозитория (fetch_repo_meta, кэш).
+    Тикет с несколькими метками типа учитывается в каждой из них — так же,
+    как в _count_issues.
+    """
+    meta = await fetch_repo_meta(client, repo, headers)
+    base = f"repo:{repo} is:issue updated:>={since_iso}"
+    searches: Dict[str, str] = {"total": base, "open": f"{base} is:open"}
+    for i, tag in enumerate(_TYPES):
+        searches[f"t{i}"] = f'{base} label:"{tag}"'
+    priority_names: List[str] = []
+    for label in meta["labels"]:
+        lower = label.lower()
+        if lower[:9] == "priority:" and '"' not in label:
+            searches[f"p{len(priority_names)}"] = f'{base} label:"{label}"'
+            priority_names.append(lower[9:].strip())
+
+    params = ", ".join(f"${alias}: String!" for alias in searches)
+    fields = " ".join(
+        f"{alias}: search(query: ${alias}, type: ISSUE) {{ issueCount }}"
+        for alias in searches
+    )
+    resp = await graphql(client, headers, f"query({params}) {{ {fields} }}", searches)
+    data = resp.get("data")
+    if not data:
+        errors = resp.get("errors") or [{}]
+        raise RuntimeError(f"GraphQL: {errors[0].get('message')}")
+
+    types = Counter(
+        {tag: data[f"t{i}"]["issueCount"] for i, tag in enumerate(_TYPES)}
+    )
+    priorities: Counter = Counter()
+    for i, value in enumerate(priority_names):
+        priorities[value] += data[f"p{i}"]["issueCount"]
+
+    # нулевые счётчики в отчёт не попадают — как и при подсчёте по списку
+    return (
+        data["total"]["issueCount"],
+        data["open"]["issueCount"],
+        +types,
+        +priorities,
+    )
+
+
 @mcp.tool()
 async def generate_support_report(
     period_days: int = Field(
@@ -35,76 +136,48 @@ async def generate_support_report(
     - распределение по типу (bug/feature/question/support по labels);
     - базовое распределение по приоритету (priority: ...).
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("generate_support_report") as span:
-        span.set_attribute("period_days", period_days)
-
+    with tool_span(tracer, "generate_support_report", period_days=period_days):
         try:
-            await ctx.info(
+            started = time.monotonic()
+            await log_info(
+                ctx,
                 f"📊 Генерируем отчёт по тикетам за последние {period_days} дней"
             )
             await ctx.report_progress(progress=0, total=100)
 
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
-            span.set_attribute("github_repo", repo)
-
-            headers: Dict[str, str] = {"Accept": "application/vnd.github+json"}
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
+            repo, token, headers = github_config()
 
             now = datetime.datetime.now(datetime.timezone.utc)
-            since_dt = now - datetime.timedelta(days=period_days)
-            since_iso = since_dt.isoformat().replace("+00:00", "Z")
-
-            url = f"https://api.github.com/repos/{repo}/issues"
-            params = {
-                "state": "all",
-                "since": since_iso,
-                "per_page": 100,
-            }
-
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                resp = await client.get(url, headers=headers, params=params)
-                resp.raise_for_status()
-                issues: List[Dict[str, Any]] = resp.json()
-
-            await ctx.report_progress(progress=60, total=100)
-
-            total = 0
-            opened = 0
-            closed = 0
-            types = Counter()
-            priorities = Counter()
-
-            for issue in issues:
-                if "pull_request" in issue:
-                    continue  # PR не считаем
-
-                total += 1
-                state = issue.get("state") or "open"
-                if state == "open":
-                    opened += 1
-                else:
-                    closed += 1
-
-                labels = [l.get("name", "").lower() for l in issue.get("labels", [])]
+            # с точностью до минуты — повторный отчёт в ту же минуту
+            # ревалидируется по ETag
+            since_dt = (now - datetime.timedelta(days=period_days)).replace(
+                second=0, microsecond=0
+            )
+            since_iso = since_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-                # тип тикета по label (bug/feature/question/support)
-                for t in ("bug", "feature", "question", "support"):
-                    if t in labels:
-                        types[t] += 1
-                        break
+            client = get_client()
+            if token:
+                # с токеном — только счётчики (GraphQL search), без выгрузки тикетов
+                total, opened, types, priorities = await _count_issues_search(
+                    client, repo, headers, since_iso
+                )
+            else:
+                url = issues_path(repo)
+                params = {
+                    "state": "all",
+                    "since": since_iso,
+                    "per_page": 100,
+                }
+                issues: List[Dict[str, Any]] = await fetch_all_pages(
+                    client, url, headers, params, _thin
+                )
+                total, opened, types, priorities = _count_issues(issues)
+            closed = total - opened
 
-                # приоритет по label `priority: ...`
-                for lbl in labels:
-                    if lbl.startswith("priority:"):
-                        pr = lbl.split(":", 1)[1].strip()
-                        priorities[pr] += 1
+            await maybe_progress(ctx, 60, started)
 
             await ctx.report_progress(progress=100, total=100)
 
@@ -117,13 +190,17 @@ async def generate_support_report(
                 "Распределение по типам:",
             ]
             if types:
-                lines.extend(f"- {t}: {c}" for t, c in types.items())
+                lines.extend(
+                    _FMT_COUNT(tag, types[tag]) for tag in _TYPES if tag in types
+                )
             else:
                 lines.append("- (типы по labels не определены)")
 
             lines.extend(("", "Распределение по приоритетам:"))
-            if priorities:
-                lines.extend(f"- {p}: {c}" for p, c in priorities.items())
+            # по имени приоритета: порядок не зависит от порядка меток и пути подсчёта
+            priorities_sorted = dict(sorted(priorities.items()))
+            if priorities_sorted:
+                lines.extend(starmap(_FMT_COUNT, priorities_sorted.items()))
             else:
                 lines.append("- (приоритеты по labels не определены)")
 
@@ -134,11 +211,11 @@ async def generate_support_report(
                 "total": total,
                 "opened": opened,
                 "closed": closed,
-                "types": dict(types),
-                "priorities": dict(priorities),
+                "types": {tag: types[tag] for tag in _TYPES if tag in types},
+                "priorities": priorities_sorted,
             }
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content=structured,
                 meta={"repo": repo},
@@ -1,20 +1,54 @@
 """Инструмент для получения новых тикетов (issues) из GitHub."""
 
 import datetime
-import os
+import time
+from itertools import chain
 from typing import Any, Dict, List
 
 import httpx
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import ToolResult, github_config, log_info, maybe_progress, tool_span
+from ._gh_cache import conditional_get
+from ._http import get_client
 
 tracer = trace.get_tracer(__name__)
 
+_FMT_TICKET = "- #{number} [{state}] {title} (от {user})".format_map
+
+# Ответ без тикетов одинаков для всех вызовов, кроме meta, — собираем его
+# один раз и на пустом результате только копируем с новой meta
+_EMPTY_RESULT = ToolResult(
+    content=[
+        TextContent(
+            type="text", text="За указанный период новых тикетов в GitHub не найдено."
+        )
+    ],
+    structured_content={"tickets": []},
+)
+
+
+def _simplify(page: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Нужные инструменту поля тикетов из ответа Search API."""
+    return [
+        {
+            "id": issue.get("id"),
+            "number": issue.get("number"),
+            "title": issue.get("title"),
+            "state": issue.get("state"),
+            "created_at": issue.get("created_at"),
+            "updated_at": issue.get("updated_at"),
+            "url": issue.get("html_url"),
+            "user": issue.get("user", {}).get("login"),
+        }
+        for issue in page.get("items", [])
+    ]
+
 
 @mcp.tool()
 async def get_new_tickets(
@@ -36,86 +70,66 @@ async def get_new_tickets(
     Returns:
         ToolResult: Список тикетов и краткое человекочитаемое описание.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("get_new_tickets") as span:
-        span.set_attribute("since_minutes", since_minutes)
-
+    with tool_span(tracer, "get_new_tickets", since_minutes=since_minutes):
         try:
-            await ctx.info("🚀 Начинаем загрузку тикетов из GitHub")
+            started = time.monotonic()
+            await log_info(ctx, "🚀 Начинаем загрузку тикетов из GitHub")
             await ctx.report_progress(progress=0, total=100)
 
             # 1) Настройки GitHub из окружения
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")  # может быть пустым
-
-            span.set_attribute("github_repo", repo)
+            repo, token, headers = github_config()  # token может быть пустым
 
             # 2) Считаем since для GitHub API
             now = datetime.datetime.now(datetime.timezone.utc)
-            since_dt = now - datetime.timedelta(minutes=since_minutes)
-            since_iso = f"{since_dt.isoformat()}Z"
-
-            await ctx.info(f"📅 Берём тикеты с {since_iso}")
-            await ctx.report_progress(progress=20, total=100)
+            # с точностью до минуты: внутри минуты URL запроса не меняется,
+            # и повторный вызов ревалидируется по ETag (304 без тела)
+            since_dt = (now - datetime.timedelta(minutes=since_minutes)).replace(
+                second=0, microsecond=0
+            )
+            since_iso = since_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-            # 3) Запрос к GitHub Issues API
-            url = f"https://api.github.com/repos/{repo}/issues"
-            headers: Dict[str, str] = {
-                "Accept": "application/vnd.github+json",
-            }
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
+            await log_info(ctx, f"📅 Берём тикеты с {since_iso}")
+            await maybe_progress(ctx, 20, started)
 
+            # 3) Запрос к GitHub Search API: is:issue отсекает pull request'ы
+            #    на стороне GitHub, и они не скачиваются вместе с тикетами
+            url = "/search/issues"
             params = {
-                "since": since_iso,
-                "state": "all",
+                "q": f"repo:{repo} is:issue updated:>={since_iso}",
+                "sort": "updated",
+                "order": "desc",
             }
 
-            await ctx.info("📡 Запрашиваем GitHub Issues API")
-            await ctx.report_progress(progress=50, total=100)
-
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                response = await client.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                issues: List[Dict[str, Any]] = response.json()
-
-            await ctx.info(f"✅ Получено тикетов: {len(issues)}")
-            await ctx.report_progress(progress=80, total=100)
-
-            simplified: List[Dict[str, Any]] = [
-                {
-                    "id": issue.get("id"),
-                    "number": issue.get("number"),
-                    "title": issue.get("title"),
-                    "state": issue.get("state"),
-                    "created_at": issue.get("created_at"),
-                    "updated_at": issue.get("updated_at"),
-                    "url": issue.get("html_url"),
-                    "user": issue.get("user", {}).get("login"),
-                }
-                for issue in issues
-                if "pull_request" not in issue
-            ]
+            await log_info(ctx, "📡 Запрашиваем GitHub Search API")
+            await maybe_progress(ctx, 50, started)
+
+            simplified: List[Dict[str, Any]] = await conditional_get(
+                get_client(), url, headers, params, _simplify
+            )
+
+            await log_info(ctx, f"✅ Получено тикетов: {len(simplified)}")
+            await maybe_progress(ctx, 80, started)
+
             await ctx.report_progress(progress=100, total=100)
 
             if not simplified:
-                text = "За указанный период новых тикетов в GitHub не найдено."
-            else:
-                lines = ["Найденные тикеты в GitHub:"]
-                lines.extend(
-                    f"- #{item['number']} [{item['state']}] {item['title']} (от {item['user']})"
-                    for item in simplified[:10]
+                return _EMPTY_RESULT.model_copy(
+                    update={"meta": {"since_minutes": since_minutes, "repo": repo}}
                 )
-                if len(simplified) > 10:
-                    lines.append(f"... и ещё {len(simplified) - 10} тикетов.")
 
-                text = "\n".join(lines)
+            more = len(simplified) - 10
+            text = "\n".join(
+                chain(
+                    ("Найденные тикеты в GitHub:",),
+                    map(_FMT_TICKET, simplified[:10]),
+                    (f"... и ещё {more} тикетов.",) if more > 0 else (),
+                )
+            )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={"tickets": simplified},
                 meta={"since_minutes": since_minutes, "repo": repo},
@@ -1,20 +1,54 @@
 """Инструмент для поиска "застоявшихся" тикетов (давно без активности)."""
 
 import datetime
-import os
+import time
+from functools import lru_cache
+from itertools import chain
 from typing import Any, Dict, List
 
 import httpx
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import ToolResult, github_config, log_info, maybe_progress, tool_span
+from ._gh_cache import conditional_get
+from ._http import get_client
 
 tracer = trace.get_tracer(__name__)
 
+_FMT_TICKET = "- #{number} {title} (обновлён {updated_at}) -> {url}".format_map
+
+
+def _thin(page: Dict[str, Any]) -> Dict[str, Any]:
+    """Сколько всего найдено и нужные инструменту поля тикетов из ответа Search API."""
+    return {
+        "total": page.get("total_count", 0),
+        "tickets": [
+            {
+                "number": issue.get("number"),
+                "title": issue.get("title"),
+                "updated_at": issue.get("updated_at"),
+                "url": issue.get("html_url"),
+                "user": issue.get("user", {}).get("login"),
+            }
+            for issue in page.get("items", [])
+        ],
+    }
+
+
+@lru_cache(maxsize=32)
+def _empty_result(inactive_days: int) -> ToolResult:
+    """Ответ без застоявшихся тикетов (meta подставляется при копировании)."""
+    text = f"Открытых тикетов без активности дольше {inactive_days} дней не найдено."
+    return ToolResult.model_construct(
+        content=[TextContent(type="text", text=text)],
+        structured_content={"stale_tickets": []},
+    )
+
 
 @mcp.tool()
 async def get_stale_tickets(
@@ -29,98 +63,68 @@ async def get_stale_tickets(
     """
     🔍 Ищет открытые тикеты, которые давно не обновлялись.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("get_stale_tickets") as span:
-        span.set_attribute("inactive_days", inactive_days)
-
+    with tool_span(tracer, "get_stale_tickets", inactive_days=inactive_days):
         try:
-            await ctx.info(
+            started = time.monotonic()
+            await log_info(
+                ctx,
                 f"🔍 Ищем 'застоявшиеся' тикеты (без активности {inactive_days}+ дней)"
             )
             await ctx.report_progress(progress=0, total=100)
 
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
-
-            span.set_attribute("github_repo", repo)
-
-            headers: Dict[str, str] = {"Accept": "application/vnd.github+json"}
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
+            repo, token, headers = github_config()
 
             # Задаём временную границу
             now = datetime.datetime.now(datetime.timezone.utc)
-            cutoff = now - datetime.timedelta(days=inactive_days)
-
-            # Для демо возьмём до 100 открытых тикетов
-            url = f"https://api.github.com/repos/{repo}/issues"
+            # с точностью до минуты: внутри минуты запрос не меняется,
+            # и повторный вызов ревалидируется по ETag
+            cutoff = (now - datetime.timedelta(days=inactive_days)).replace(
+                second=0, microsecond=0
+            )
+            cutoff_str = cutoff.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+            # Search API сам отбирает открытые тикеты старше cutoff и отсекает
+            # pull request'ы. Берём одну страницу (100 самых старых): у Search API
+            # лимит 30 запросов в минуту (10 без токена), а выдача между
+            # страницами сдвигается, пока тикеты обновляются. Сколько всего
+            # найдено — из total_count.
+            url = "/search/issues"
             params = {
-                "state": "open",
-                "per_page": 100,
+                "q": f"repo:{repo} is:issue is:open updated:<={cutoff_str}",
                 "sort": "updated",
-                "direction": "asc",  # сначала самые старые
+                "order": "asc",  # сначала самые старые
+                "per_page": 100,
             }
 
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                resp = await client.get(url, headers=headers, params=params)
-                resp.raise_for_status()
-                issues: List[Dict[str, Any]] = resp.json()
-
-            await ctx.report_progress(progress=70, total=100)
-
-            stale: List[Dict[str, Any]] = []
-            for issue in issues:
-                if "pull_request" in issue:
-                    continue  # PR пропускаем
-
-                updated_str = issue.get("updated_at")
-                if not updated_str:
-                    continue
-
-                try:
-                    updated_dt = datetime.datetime.fromisoformat(
-                        updated_str.replace("Z", "+00:00")
-                    )
-                except Exception:
-                    continue
-
-                if updated_dt <= cutoff:
-                    stale.append(
-                        {
-                            "number": issue.get("number"),
-                            "title": issue.get("title"),
-                            "updated_at": updated_str,
-                            "url": issue.get("html_url"),
-                            "user": issue.get("user", {}).get("login"),
-                        }
-                    )
+            found: Dict[str, Any] = await conditional_get(
+                get_client(), url, headers, params, _thin
+            )
+            stale: List[Dict[str, Any]] = found["tickets"]
+
+            await maybe_progress(ctx, 70, started)
 
             await ctx.report_progress(progress=100, total=100)
 
             if not stale:
-                text = (
-                    f"Открытых тикетов без активности дольше {inactive_days} дней не найдено."
-                )
-            else:
-                lines = [
-                    f"Открытые тикеты без активности дольше {inactive_days} дней:"
-                ]
-                lines.extend(
-                    f"- #{i['number']} {i['title']} (обновлён {i['updated_at']}) -> {i['url']}"
-                    for i in stale[:20]
+                return _empty_result(inactive_days).model_copy(
+                    update={"meta": {"repo": repo, "inactive_days": inactive_days}}
                 )
-                if len(stale) > 20:
-                    lines.append(f"... и ещё {len(stale) - 20} тикетов.")
 
-                text = "\n".join(lines)
+            more = max(found["total"], len(stale)) - 20
+            text = "\n".join(
+                chain(
+                    (f"Открытые тикеты без активности дольше {inactive_days} дней:",),
+                    map(_FMT_TICKET, stale[:20]),
+                    (f"... и ещё {more} тикетов.",) if more > 0 else (),
+                )
+            )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
-                structured_content={"stale_tickets": stale},
+                structured_content={"stale_tickets": stale, "total": found["total"]},
                 meta={"repo": repo, "inactive_days": inactive_days},
             )
 
@@ -1,20 +1,23 @@
 """Инструмент для получения подробной информации о тикете (issue) из GitHub."""
 
-import os
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, List, Optional
 
 import httpx
+import orjson
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import ToolResult, github_config, log_info, maybe_progress, tool_span
+from ._gh_cache import fetch_issue_details, issue_details, issues_path
+from ._http import get_client, github_request
 
 tracer = trace.get_tracer(__name__)
 
-
 @mcp.tool()
 async def get_ticket_detail(
     issue_number: int = Field(
@@ -34,71 +37,53 @@ async def get_ticket_detail(
     Returns:
         ToolResult: Информация о тикете и краткое человекочитаемое описание.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("get_ticket_detail") as span:
-        span.set_attribute("issue_number", issue_number)
-
+    with tool_span(tracer, "get_ticket_detail", issue_number=issue_number):
         try:
-            await ctx.info(f"🚀 Загружаем детали тикета #{issue_number} из GitHub")
+            started = time.monotonic()
+            await log_info(ctx, f"🚀 Загружаем детали тикета #{issue_number} из GitHub")
             await ctx.report_progress(progress=0, total=100)
 
             # 1) Настройки GitHub из окружения
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
+            repo, token, headers = github_config()
 
-            span.set_attribute("github_repo", repo)
-
-            # 2) Запрос к GitHub Issues API
+            # 2) Запрос к GitHub: с токеном — GraphQL только за нужными полями,
+            #    без токена (или если GraphQL не вернул issue) — REST
             #    GET /repos/{owner}/{repo}/issues/{issue_number}
-            url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-            headers: Dict[str, str] = {
-                "Accept": "application/vnd.github+json",
-            }
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
+            url = f"{issues_path(repo)}/{issue_number}"
+            await log_info(ctx, f"📡 Запрашиваем GitHub API для тикета #{issue_number}")
+            await maybe_progress(ctx, 40, started)
 
-            await ctx.info(f"📡 Запрашиваем GitHub Issues API для тикета #{issue_number}")
-            await ctx.report_progress(progress=40, total=100)
+            client = get_client()
+            simplified: Optional[Dict[str, Any]] = None
+            if token:
+                found = await fetch_issue_details(client, repo, headers, [issue_number])
+                simplified = found[issue_number]
 
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                response = await client.get(url, headers=headers)
+            if simplified is None:
+                response = await github_request(client, "GET", url, headers=headers)
                 response.raise_for_status()
-                issue: Dict[str, Any] = response.json()
-
-            await ctx.info("✅ Детали тикета получены")
-            await ctx.report_progress(progress=80, total=100)
-
-            # Фильтруем случай PR (у GitHub PR = особый вид issue)
-            if "pull_request" in issue:
-                msg = "Указан номер pull request, а не обычного issue."
-                await ctx.error(msg)
-                raise McpError(
-                    ErrorData(
-                        code=-32602,
-                        message=msg,
+                issue: Dict[str, Any] = orjson.loads(response.content)
+
+                # Фильтруем случай PR (у GitHub PR = особый вид issue)
+                if "pull_request" in issue:
+                    msg = "Указан номер pull request, а не обычного issue."
+                    await ctx.error(msg)
+                    raise McpError(
+                        ErrorData(
+                            code=-32602,
+                            message=msg,
+                        )
                     )
-                )
 
-            labels: List[str] = [lbl.get("name", "") for lbl in issue.get("labels", [])]
-
-            simplified: Dict[str, Any] = {
-                "id": issue.get("id"),
-                "number": issue.get("number"),
-                "title": issue.get("title"),
-                "body": issue.get("body") or "",
-                "state": issue.get("state"),
-                "created_at": issue.get("created_at"),
-                "updated_at": issue.get("updated_at"),
-                "url": issue.get("html_url"),
-                "user": issue.get("user", {}).get("login"),
-                "assignee": (issue.get("assignee") or {}).get("login"),
-                "labels": labels,
-                "comments": issue.get("comments", 0),
-            }
+                simplified = issue_details(issue)
+
+            await log_info(ctx, "✅ Детали тикета получены")
+            await maybe_progress(ctx, 80, started)
+
+            labels: List[str] = simplified["labels"]
 
             await ctx.report_progress(progress=100, total=100)
 
@@ -121,7 +106,7 @@ async def get_ticket_detail(
                 lines.extend(("", "Описание:", body_preview))
             text = "\n".join(lines)
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={"ticket": simplified},
                 meta={"repo": repo},
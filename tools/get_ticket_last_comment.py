@@ -1,19 +1,70 @@
 """Инструмент для получения последнего комментария по тикету (issue) из GitHub."""
 
-import os
+import time
 from typing import Any, Dict, List, Optional
 
 import httpx
+import orjson
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import ToolResult, github_config, log_info, maybe_progress, tool_span
+from ._gh_cache import fetch_issue, issues_path
+from ._http import get_client, github_request, graphql
 
 tracer = trace.get_tracer(__name__)
 
+_LAST_COMMENT_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    issue(number: $number) {
+      comments(last: 1) {
+        nodes { databaseId body createdAt url author { login } }
+      }
+    }
+  }
+}
+"""
+
+
+async def _last_comments_graphql(
+    client: httpx.AsyncClient,
+    repo: str,
+    issue_number: int,
+    headers: Dict[str, str],
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Последний комментарий одним GraphQL-запросом — в формате REST API
+    (список из 0 или 1 элемента).
+
+    None, если GraphQL не нашёл issue (например, это pull request).
+    """
+    owner, name = repo.split("/", 1)
+    resp = await graphql(
+        client,
+        headers,
+        _LAST_COMMENT_QUERY,
+        {"owner": owner, "name": name, "number": issue_number},
+    )
+    issue = ((resp.get("data") or {}).get("repository") or {}).get("issue")
+    if issue is None:
+        return None
+
+    return [
+        {
+            "id": node["databaseId"],
+            "body": node["body"],
+            "user": node["author"],
+            "created_at": node["createdAt"],
+            "html_url": node["url"],
+        }
+        for node in issue["comments"]["nodes"]
+    ]
+
 
 @mcp.tool()
 async def get_ticket_last_comment(
@@ -30,75 +81,79 @@ async def get_ticket_last_comment(
     Если комментариев нет — вернёт понятный текст и comment = None
     в structured_content.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("get_ticket_last_comment") as span:
-        span.set_attribute("issue_number", issue_number)
-
+    with tool_span(
+        tracer,
+        "get_ticket_last_comment",
+        issue_number=issue_number,
+    ):
         try:
-            await ctx.info(f"🔍 Получаем последний комментарий по тикету #{issue_number}")
+            started = time.monotonic()
+            await log_info(ctx, f"🔍 Получаем последний комментарий по тикету #{issue_number}")
             await ctx.report_progress(progress=0, total=100)
 
             # 1) Настройки GitHub
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")  # может быть пустым
+            repo, token, headers = github_config()  # token может быть пустым
 
-            span.set_attribute("github_repo", repo)
+            client = get_client()
 
-            headers: Dict[str, str] = {
-                "Accept": "application/vnd.github+json",
-            }
+            # 2) С токеном — один GraphQL-запрос сразу за последним комментарием
+            comments: Optional[List[Dict[str, Any]]] = None
             if token:
-                headers["Authorization"] = f"Bearer {token}"
+                await log_info(ctx, "📡 Запрашиваем последний комментарий (GraphQL)")
+                comments = await _last_comments_graphql(
+                    client, repo, issue_number, headers
+                )
 
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                # 2) Сначала узнаём количество комментариев у issue
-                issue_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-                await ctx.info("📡 Запрашиваем данные тикета (количество комментариев)")
-                issue_resp = await client.get(issue_url, headers=headers)
-                issue_resp.raise_for_status()
-                issue_data: Dict[str, Any] = issue_resp.json()
-                comments_count: int = issue_data.get("comments", 0)
+            if comments is None:
+                # 3) REST: количество комментариев берём из issue (кэш + ETag),
+                #    затем последний комментарий: per_page=1, page=comments_count
+                await log_info(ctx, "📡 Запрашиваем данные тикета (количество комментариев)")
+                issue = await fetch_issue(client, repo, issue_number, headers)
+                comments_count: int = issue["comments"]
 
-                await ctx.report_progress(progress=40, total=100)
+                await maybe_progress(ctx, 40, started)
 
                 if comments_count == 0:
-                    text = f"У тикета #{issue_number} пока нет комментариев."
-                    await ctx.info(text)
-                    await ctx.report_progress(progress=100, total=100)
-
-                    return ToolResult(
-                        content=[TextContent(type="text", text=text)],
-                        structured_content={
-                            "issue_number": issue_number,
-                            "comment": None,
-                        },
-                        meta={"repo": repo},
+                    comments = []
+                else:
+                    comments_url = f"{issues_path(repo)}/{issue_number}/comments"
+                    params = {
+                        "per_page": 1,
+                        "page": comments_count,
+                    }
+
+                    await log_info(ctx, "📡 Запрашиваем последний комментарий")
+                    comments_resp = await github_request(
+                        client, "GET", comments_url, headers=headers, params=params
                     )
-
-                # 3) Берём последний комментарий: per_page=1, page=comments_count
-                comments_url = f"{issue_url}/comments"
-                params = {
-                    "per_page": 1,
-                    "page": comments_count,
-                }
-
-                await ctx.info("📡 Запрашиваем последний комментарий")
-                comments_resp = await client.get(comments_url, headers=headers, params=params)
-                comments_resp.raise_for_status()
-                comments: List[Dict[str, Any]] = comments_resp.json()
-
-            await ctx.report_progress(progress=80, total=100)
+                    comments_resp.raise_for_status()
+                    comments = orjson.loads(comments_resp.content)
+
+                    if not comments:
+                        # На всякий случай — маловероятно, но вдруг
+                        text = (
+                            f"Не удалось получить комментарии для тикета #{issue_number}."
+                        )
+                        await log_info(ctx, text)
+                        await ctx.report_progress(progress=100, total=100)
+                        return ToolResult.model_construct(
+                            content=[TextContent(type="text", text=text)],
+                            structured_content={
+                                "issue_number": issue_number,
+                                "comment": None,
+                            },
+                            meta={"repo": repo},
+                        )
 
             if not comments:
-                # На всякий случай — маловероятно, но вдруг
-                text = f"Не удалось получить комментарии для тикета #{issue_number}."
-                await ctx.info(text)
+                text = f"У тикета #{issue_number} пока нет комментариев."
+                await log_info(ctx, text)
                 await ctx.report_progress(progress=100, total=100)
-                return ToolResult(
+
+                return ToolResult.model_construct(
                     content=[TextContent(type="text", text=text)],
                     structured_content={
                         "issue_number": issue_number,
@@ -107,6 +162,8 @@ async def get_ticket_last_comment(
                     meta={"repo": repo},
                 )
 
+            await maybe_progress(ctx, 80, started)
+
             last = comments[0]
 
             body: str = last.get("body") or ""
@@ -134,10 +191,10 @@ async def get_ticket_last_comment(
             ]
             text = "\n".join(text_lines)
 
-            await ctx.info("✅ Последний комментарий успешно получен")
+            await log_info(ctx, "✅ Последний комментарий успешно получен")
             await ctx.report_progress(progress=100, total=100)
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={"comment": simplified},
                 meta={"repo": repo},
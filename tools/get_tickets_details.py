@@ -0,0 +1,131 @@
+"""Инструмент для получения деталей нескольких тикетов (issues) GitHub за один вызов."""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import orjson
+from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
+from mcp.types import TextContent
+from opentelemetry import trace
+from pydantic import Field
+
+from mcp_instance import mcp
+from .utils import ToolResult, github_config, log_info, maybe_progress, tool_span
+from ._gh_cache import fetch_issue_details, issue_details, issues_path
+from ._http import get_client, github_request
+
+tracer = trace.get_tracer(__name__)
+
+_FMT_TICKET = "- #{number} [{state}] {title} (от {user}) -> {url}".format_map
+
+
+async def _ticket_rest(
+    client: httpx.AsyncClient,
+    repo: str,
+    issue_number: int,
+    headers: Dict[str, str],
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Детали одного тикета через REST: (тикет, None) или (None, причина)."""
+    response = await github_request(
+        client, "GET", f"{issues_path(repo)}/{issue_number}", headers=headers
+    )
+    if response.status_code == 404:
+        return None, "тикет не найден"
+    response.raise_for_status()
+    issue: Dict[str, Any] = orjson.loads(response.content)
+    if "pull_request" in issue:
+        return None, "это pull request, а не issue"
+    return issue_details(issue), None
+
+
+@mcp.tool()
+async def get_tickets_details(
+    issue_numbers: List[int] = Field(
+        ...,
+        min_length=1,
+        max_length=50,
+        description="Номера issue в GitHub (до 50), например [3, 7, 12].",
+    ),
+    ctx: Context | None = None,
+) -> ToolResult:
+    """
+    📝 Детали нескольких тикетов за один вызов.
+
+    С GITHUB_TOKEN все тикеты запрашиваются одним GraphQL-запросом,
+    без токена — параллельными запросами к REST API.
+    """
+    if ctx is None:
+        ctx = Context()
+
+    numbers = list(dict.fromkeys(issue_numbers))
+
+    with tool_span(tracer, "get_tickets_details", issues_count=len(numbers)):
+        try:
+            started = time.monotonic()
+            await log_info(ctx, f"🚀 Загружаем детали тикетов: {len(numbers)} шт.")
+            await ctx.report_progress(progress=0, total=100)
+
+            repo, token, headers = github_config()
+
+            client = get_client()
+            found: Dict[int, Optional[Dict[str, Any]]] = {}
+            if token:
+                found = await fetch_issue_details(client, repo, headers, numbers)
+
+            await maybe_progress(ctx, 50, started)
+
+            # номера, по которым GraphQL ничего не вернул (или токена нет),
+            # проверяем через REST — он же объясняет, почему тикета нет
+            missing = [n for n in numbers if found.get(n) is None]
+            errors: Dict[int, str] = {}
+            results = await asyncio.gather(
+                *(_ticket_rest(client, repo, n, headers) for n in missing)
+            )
+            for number, (ticket, error) in zip(missing, results):
+                found[number] = ticket
+                if error:
+                    errors[number] = error
+
+            await ctx.report_progress(progress=100, total=100)
+
+            tickets = [found[n] for n in numbers if found[n] is not None]
+
+            lines = [f"Тикеты из GitHub ({len(tickets)} из {len(numbers)}):"]
+            lines.extend(map(_FMT_TICKET, tickets))
+            lines.extend(f"- #{n}: {error}" for n, error in errors.items())
+            text = "\n".join(lines)
+
+            return ToolResult.model_construct(
+                content=[TextContent(type="text", text=text)],
+                structured_content={"tickets": tickets, "errors": errors},
+                meta={"repo": repo},
+            )
+
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code if e.response else "unknown"
+            await ctx.error(f"❌ HTTP ошибка GitHub API: {status}")
+            raise McpError(
+                ErrorData(
+                    code=-32603,
+                    message=f"Ошибка при запросе к GitHub API: {status}",
+                )
+            ) from e
+        except ValueError as e:
+            await ctx.error(f"❌ Ошибка конфигурации: {e}")
+            raise McpError(
+                ErrorData(
+                    code=-32602,
+                    message=f"Неверная конфигурация окружения: {e}",
+                )
+            ) from e
+        except Exception as e:
+            await ctx.error(f"💥 Неожиданная ошибка: {e}")
+            raise McpError(
+                ErrorData(
+                    code=-32603,
+                    message=f"Неожиданная ошибка: {e}",
+                )
+            ) from e
@@ -1,16 +1,25 @@
 """Инструмент для добавления ответа (комментария) в тикет GitHub."""
 
-import os
-from typing import Dict
+import time
 
 import httpx
+import orjson
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import (
+    ToolResult,
+    checked_github_config,
+    log_info,
+    maybe_progress,
+    tool_span,
+)
+from ._http import get_client, github_request
+from ._gh_cache import invalidate_issue, issues_path
 
 tracer = trace.get_tracer(__name__)
 
@@ -41,61 +50,60 @@ async def post_ticket_reply(
     Returns:
         ToolResult: Краткое описание результата и ссылка на комментарий.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("post_ticket_reply") as span:
-        span.set_attribute("issue_number", issue_number)
-
+    # 1) Настройки GitHub — проверяем до span'а: без них в GitHub не пойдём
+    repo, token, headers = await checked_github_config(ctx)
+    if not token:
+        msg = (
+            "Для добавления комментария требуется GITHUB_TOKEN с правами "
+            "на запись в репозиторий."
+        )
+        await ctx.error(msg)
+        raise McpError(
+            ErrorData(
+                code=-32602,
+                message=msg,
+            )
+        )
+
+    # вызванный из другого инструмента — событие в его span'е, а не свой span
+    with tool_span(
+        tracer,
+        "post_ticket_reply",
+        nested_as_event=True,
+        issue_number=issue_number,
+    ):
         try:
-            await ctx.info(
+            started = time.monotonic()
+            await log_info(
+                ctx,
                 f"📝 Пытаемся оставить комментарий в тикете #{issue_number} в GitHub"
             )
             await ctx.report_progress(progress=0, total=100)
 
-            # 1) Настройки GitHub
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
-            if not token:
-                msg = (
-                    "Для добавления комментария требуется GITHUB_TOKEN с правами "
-                    "на запись в репозиторий."
-                )
-                await ctx.error(msg)
-                raise McpError(
-                    ErrorData(
-                        code=-32602,
-                        message=msg,
-                    )
-                )
-
-            span.set_attribute("github_repo", repo)
-
             # 2) Формируем запрос к GitHub API
             #    POST /repos/{owner}/{repo}/issues/{issue_number}/comments
-            url = (
-                f"https://api.github.com/repos/{repo}/issues/"
-                f"{issue_number}/comments"
-            )
-            headers: Dict[str, str] = {
-                "Accept": "application/vnd.github+json",
-                "Authorization": f"Bearer {token}",
-            }
+            url = f"{issues_path(repo)}/{issue_number}/comments"
             payload = {
                 "body": reply_text,
             }
 
-            await ctx.info("📡 Отправляем комментарий в GitHub")
-            await ctx.report_progress(progress=40, total=100)
+            await log_info(ctx, "📡 Отправляем комментарий в GitHub")
+            await maybe_progress(ctx, 40, started)
+
+            client = get_client()
+            response = await github_request(
+                client, "POST", url, headers=headers, json=payload
+            )
+            response.raise_for_status()
+            comment_data = orjson.loads(response.content)
 
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                response.raise_for_status()
-                comment_data = response.json()
+            # Комментарии тикета изменились — закэшированные данные больше не верны
+            invalidate_issue(repo, issue_number)
 
-            await ctx.info("✅ Комментарий успешно добавлен")
+            await log_info(ctx, "✅ Комментарий успешно добавлен")
             await ctx.report_progress(progress=100, total=100)
 
             comment_url = comment_data.get("html_url")
@@ -110,7 +118,7 @@ async def post_ticket_reply(
                 "comment_id": comment_data.get("id"),
             }
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={"comment": simplified},
                 meta={"repo": repo},
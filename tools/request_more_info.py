@@ -1,18 +1,37 @@
 """Инструмент для автоматического запроса дополнительной информации у пользователя."""
 
+import time
 from typing import Optional
 
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 
 from mcp_instance import mcp
-from .utils import ToolResult
+from .utils import ToolResult, log_info, maybe_progress, tool_span
 from .get_ticket_last_comment import get_ticket_last_comment
 from .post_ticket_reply import post_ticket_reply
 
 tracer = trace.get_tracer(__name__)
 
+# Постоянные части промпта и ответа — на вызов подставляется только текст
+_PROMPT_HEAD = (
+    "Ты — вежливый и грамотный специалист 1-й линии поддержки.\n"
+    "По тексту обращения пользователя предложи до 5 конкретных "
+    "уточняющих вопросов, которые помогут быстрее диагностировать проблему.\n"
+    "Пиши по-русски, вежливо, в виде нумерованного списка.\n\n"
+    "Текст последнего сообщения пользователя:\n"
+)
+_PROMPT_TAIL = (
+    "\n\n"
+    "Если вопросов нет, напиши одну строку: 'На данный момент уточнений не требуется.'"
+)
+_REPLY_HEAD = (
+    "Здравствуйте! Спасибо за обращение.\n\n"
+    "Чтобы мы могли быстрее помочь, уточните, пожалуйста, несколько моментов:\n\n"
+)
+
 
 @mcp.tool()
 async def request_more_info(
@@ -26,16 +45,14 @@ async def request_more_info(
     2) Просим модель сформулировать уточняющие вопросы.
     3) Оставляем комментарий в GitHub от имени агента.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("request_more_info") as span:
-        span.set_attribute("issue_number", issue_number)
-
+    with tool_span(tracer, "request_more_info", issue_number=issue_number):
         try:
-            await ctx.info(
+            started = time.monotonic()
+            await log_info(
+                ctx,
                 f"❓ Формируем уточняющие вопросы по тикету #{issue_number}"
             )
             await ctx.report_progress(progress=0, total=100)
@@ -54,31 +71,20 @@ async def request_more_info(
             if not last_body:
                 last_body = "Пользователь пока не оставил подробного описания."
 
-            await ctx.report_progress(progress=30, total=100)
+            await maybe_progress(ctx, 30, started)
 
             # 2) Просим модель сформулировать вопросы
-            prompt_text = (
-                "Ты — вежливый и грамотный специалист 1-й линии поддержки.\n"
-                "По тексту обращения пользователя предложи до 5 конкретных "
-                "уточняющих вопросов, которые помогут быстрее диагностировать проблему.\n"
-                "Пиши по-русски, вежливо, в виде нумерованного списка.\n\n"
-                f"Текст последнего сообщения пользователя:\n{last_body}\n\n"
-                "Если вопросов нет, напиши одну строку: 'На данный момент уточнений не требуется.'"
-            )
+            prompt_text = f"{_PROMPT_HEAD}{last_body}{_PROMPT_TAIL}"
 
             ai_answer = await ctx.prompt(prompt_text)
             questions_text = (
                 ai_answer if isinstance(ai_answer, str) else str(ai_answer)
             )
 
-            await ctx.report_progress(progress=60, total=100)
+            await maybe_progress(ctx, 60, started)
 
             # 3) Публикуем комментарий в тикете
-            reply_text = (
-                "Здравствуйте! Спасибо за обращение.\n\n"
-                "Чтобы мы могли быстрее помочь, уточните, пожалуйста, несколько моментов:\n\n"
-                f"{questions_text}"
-            )
+            reply_text = _REPLY_HEAD + questions_text
 
             _ = await post_ticket_reply(
                 issue_number=issue_number,
@@ -92,7 +98,7 @@ async def request_more_info(
                 f"Уточняющие вопросы отправлены в тикет #{issue_number}."
             )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=human_text)],
                 structured_content={
                     "issue_number": issue_number,
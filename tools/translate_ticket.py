@@ -1,20 +1,41 @@
 """Инструмент для автоматического перевода тикета (title/body/комментарии)."""
 
-import os
-from typing import Any, Dict, List, Optional
+import time
+from typing import List, Optional
 
 import httpx
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import (
+    ToolResult,
+    checked_github_config,
+    log_info,
+    maybe_progress,
+    tool_span,
+)
+from ._gh_cache import fetch_issue_and_comments
+from ._http import get_client
 from .post_ticket_reply import post_ticket_reply
 
 tracer = trace.get_tracer(__name__)
 
+# Постоянные части промпта — на каждый вызов подставляются только язык и текст
+_PROMPT_HEAD = (
+    "Ты — профессиональный переводчик технических текстов.\n"
+    "Переведи следующий текст на язык '"
+)
+_PROMPT_MID = (
+    "'.\n"
+    "Сохраняй структуру (заголовки, разделы), но не добавляй пояснений от себя.\n\n"
+    "=== ТЕКСТ ДЛЯ ПЕРЕВОДА ===\n"
+)
+_PROMPT_TAIL = "\n=== КОНЕЦ ТЕКСТА ==="
+
 
 @mcp.tool()
 async def translate_ticket(
@@ -50,62 +71,49 @@ async def translate_ticket(
     - для перевода обращения клиента для русской команды;
     - для ответа клиенту на его языке.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("translate_ticket") as span:
-        span.set_attribute("issue_number", issue_number)
-        span.set_attribute("target_lang", target_lang)
+    repo, token, headers = await checked_github_config(ctx)
 
+    with tool_span(
+        tracer,
+        "translate_ticket",
+        issue_number=issue_number,
+        target_lang=target_lang,
+    ):
         try:
-            await ctx.info(
+            started = time.monotonic()
+            await log_info(
+                ctx,
                 f"🌐 Переводим тикет #{issue_number} на язык {target_lang!r}"
             )
             await ctx.report_progress(progress=0, total=100)
 
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
-            span.set_attribute("github_repo", repo)
-
-            headers: Dict[str, str] = {"Accept": "application/vnd.github+json"}
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
-
-            base_issue_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                # 1) сам тикет
-                resp_issue = await client.get(base_issue_url, headers=headers)
-                resp_issue.raise_for_status()
-                issue: Dict[str, Any] = resp_issue.json()
-
-                title: str = issue.get("title") or ""
-                body: str = issue.get("body") or ""
-                issue_url: str = issue.get("html_url") or ""
-
-                comments_block = ""
-                if include_comments and comments_limit > 0:
-                    comments_url = f"{base_issue_url}/comments"
-                    resp_comments = await client.get(
-                        comments_url,
-                        headers=headers,
-                        params={"per_page": max(comments_limit, 10)},
-                    )
-                    resp_comments.raise_for_status()
-                    comments: List[Dict[str, Any]] = resp_comments.json()
-
-                    # Берём последние comments_limit
-                    last_comments = comments[-comments_limit:]
-                    parts: List[str] = []
-                    for c in last_comments:
-                        author = (c.get("user") or {}).get("login") or "unknown"
-                        text = c.get("body") or ""
-                        parts.append(f"[{author}]: {text}")
-                    comments_block = "\n".join(parts)
-
-            await ctx.report_progress(progress=30, total=100)
+            client = get_client()
+            # 1) сам тикет и его последние комментарии — с токеном одним
+            #    GraphQL-запросом, через общий кэш инструментов по тикету
+            issue, comments = await fetch_issue_and_comments(
+                client,
+                repo,
+                issue_number,
+                headers,
+                comments_limit if include_comments else 0,
+                use_graphql=bool(token),
+            )
+
+            title: str = issue["title"]
+            body: str = issue["body"]
+            issue_url: str = issue["html_url"]
+
+            comments_block = ""
+            if comments:
+                # комментарии уже последние comments_limit
+                comments_block = "\n".join(
+                    f"[{c['author']}]: {c['body']}" for c in comments
+                )
+
+            await maybe_progress(ctx, 30, started)
 
             # 2) Собираем текст для перевода
             src_text_parts: List[str] = [
@@ -119,20 +127,15 @@ async def translate_ticket(
 
             # 3) Просим модель перевести
             prompt_text = (
-                "Ты — профессиональный переводчик технических текстов.\n"
-                f"Переведи следующий текст на язык '{target_lang}'.\n"
-                "Сохраняй структуру (заголовки, разделы), но не добавляй пояснений от себя.\n\n"
-                "=== ТЕКСТ ДЛЯ ПЕРЕВОДА ===\n"
-                f"{src_text}\n"
-                "=== КОНЕЦ ТЕКСТА ==="
+                f"{_PROMPT_HEAD}{target_lang}{_PROMPT_MID}{src_text}{_PROMPT_TAIL}"
             )
 
-            await ctx.report_progress(progress=50, total=100)
+            await maybe_progress(ctx, 50, started)
 
             ai_answer = await ctx.prompt(prompt_text)
             translated_text = ai_answer if isinstance(ai_answer, str) else str(ai_answer)
 
-            await ctx.report_progress(progress=80, total=100)
+            await maybe_progress(ctx, 80, started)
 
             comment_url: Optional[str] = None
             if post_comment:
@@ -156,7 +159,7 @@ async def translate_ticket(
                 + (" Результат отправлен в комментарий." if post_comment else "")
             )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=human)],
                 structured_content={
                     "issue_number": issue_number,
@@ -1,19 +1,30 @@
 """Инструмент для управления приоритетом, лейблами и исполнителем тикета в GitHub."""
 
-import os
+import asyncio
+from operator import itemgetter
 from typing import Any, Dict, List, Optional
 
 import httpx
+import orjson
 from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
 from opentelemetry import trace
 from pydantic import Field
 
 from mcp_instance import mcp
-from .utils import ToolResult, require_env
+from .utils import ToolResult, github_config, log_info, tool_span
+from ._gh_cache import issues_path, remember_issue, revalidate_issue
+from ._http import get_client, github_request
 
 tracer = trace.get_tracer(__name__)
 
+_PRIORITY_PREFIX = "priority:"
+_PRIORITY_LEN = len(_PRIORITY_PREFIX)
+
+_NAME = itemgetter("name")
+_LOGIN = itemgetter("login")
+
 
 @mcp.tool()
 async def update_ticket_meta(
@@ -52,22 +63,21 @@ async def update_ticket_meta(
     - список labels;
     - исполнителя.
     """
-    from mcp.shared.exceptions import McpError, ErrorData
-
     if ctx is None:
         ctx = Context()
 
-    with tracer.start_as_current_span("update_ticket_meta") as span:
-        span.set_attribute("issue_number", issue_number)
-        span.set_attribute("priority", priority or "")
-        span.set_attribute("assignee", assignee or "")
-
+    with tool_span(
+        tracer,
+        "update_ticket_meta",
+        issue_number=issue_number,
+        priority=priority or "",
+        assignee=assignee or "",
+    ):
         try:
-            await ctx.info(f"⚙️ Обновляем метаданные тикета #{issue_number}")
+            await log_info(ctx, f"⚙️ Обновляем метаданные тикета #{issue_number}")
             await ctx.report_progress(progress=0, total=100)
 
-            repo = require_env("GITHUB_REPO")
-            token = os.getenv("GITHUB_TOKEN")
+            repo, token, headers = github_config()
 
             if not token:
                 msg = "Для обновления тикета требуется GITHUB_TOKEN с правами записи."
@@ -79,82 +89,95 @@ async def update_ticket_meta(
                     )
                 )
 
-            span.set_attribute("github_repo", repo)
+            base_url = f"{issues_path(repo)}/{issue_number}"
 
-            base_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-            headers: Dict[str, str] = {
-                "Accept": "application/vnd.github+json",
-                "Authorization": f"Bearer {token}",
-            }
+            client = get_client()
 
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                # 1) забираем текущий issue, чтобы не потерять метки
-                resp_issue = await client.get(base_url, headers=headers)
-                resp_issue.raise_for_status()
-                issue: Dict[str, Any] = resp_issue.json()
+            new_labels: List[str] = []
+            # если labels переданы — используем их как базу
+            if labels is not None:
+                # повторы в переданном списке убираем, порядок сохраняем
+                new_labels = list(dict.fromkeys(labels))
+            elif priority is not None:
+                # 1) текущие метки нужны, только чтобы сменить приоритет, не
+                #    потеряв остальные; если тикет не менялся с прошлого раза,
+                #    GitHub ответит 304 по ETag
+                issue = await revalidate_issue(client, repo, issue_number, headers)
+                new_labels = list(issue["labels"])
 
-                current_labels: List[str] = [
-                    l.get("name", "") for l in issue.get("labels", [])
+            # приоритет через label `priority: ...` — старый приоритет
+            # отбрасывается и новый добавляется в один проход
+            if priority:
+                new_labels = [
+                    *dict.fromkeys(
+                        l
+                        for l in new_labels
+                        if l[:_PRIORITY_LEN].lower() != _PRIORITY_PREFIX
+                    ),
+                    f"priority: {priority}",
                 ]
 
-                new_labels = list(current_labels)
+            payload: Dict[str, Any] = {}
 
-                # если labels переданы — используем их как базу
-                if labels is not None:
-                    new_labels = list(labels)
+            if labels is not None or priority is not None:
+                payload["labels"] = new_labels
 
-                # приоритет через label `priority: ...`
-                if priority:
-                    new_labels = [
-                        l for l in new_labels if not l.lower().startswith("priority:")
-                    ]
-                    new_labels.append(f"priority: {priority}")
+            # исполнитель
+            if assignee is not None:
+                if assignee == "":
+                    payload["assignees"] = []
+                else:
+                    payload["assignees"] = [assignee]
 
-                payload: Dict[str, Any] = {}
-
-                if labels is not None or priority is not None:
-                    payload["labels"] = new_labels
-
-                # исполнитель
-                if assignee is not None:
-                    if assignee == "":
-                        payload["assignees"] = []
-                    else:
-                        payload["assignees"] = [assignee]
-
-                if not payload:
-                    text = (
-                        f"Для тикета #{issue_number} не передано ни одной настройки. "
-                        "Нечего обновлять."
-                    )
-                    await ctx.info(text)
-                    await ctx.report_progress(progress=100, total=100)
-                    return ToolResult(
-                        content=[TextContent(type="text", text=text)],
-                        structured_content={
-                            "issue_number": issue_number,
-                            "updated": False,
-                        },
-                        meta={"repo": repo},
-                    )
-
-                await ctx.info("📡 Отправляем PATCH в GitHub Issues API")
-                await ctx.report_progress(progress=40, total=100)
+            if not payload:
+                text = (
+                    f"Для тикета #{issue_number} не передано ни одной настройки. "
+                    "Нечего обновлять."
+                )
+                await log_info(ctx, text)
+                await ctx.report_progress(progress=100, total=100)
+                return ToolResult.model_construct(
+                    content=[TextContent(type="text", text=text)],
+                    structured_content={
+                        "issue_number": issue_number,
+                        "updated": False,
+                    },
+                    meta={"repo": repo},
+                )
 
-                resp_update = await client.patch(
+            # сообщение клиенту уходит параллельно с PATCH, а не перед ним
+            _, resp_update = await asyncio.gather(
+                log_info(ctx, "📡 Отправляем PATCH в GitHub Issues API"),
+                github_request(
+                    client,
+                    "PATCH",
                     base_url,
                     headers=headers,
                     json=payload,
+                ),
+            )
+            if resp_update.is_error:
+                # ожидаемые отказы GitHub (404, 422 — например, нет такого
+                # исполнителя) — сразу McpError с текстом ответа, без
+                # HTTPStatusError
+                status = resp_update.status_code
+                await ctx.error(f"❌ HTTP ошибка GitHub API: {status}")
+                raise McpError(
+                    ErrorData(
+                        code=-32603,
+                        message=(
+                            f"Ошибка при запросе к GitHub API: {status}: "
+                            f"{resp_update.text[:200]}"
+                        ),
+                    )
                 )
-                resp_update.raise_for_status()
-                updated: Dict[str, Any] = resp_update.json()
+            updated: Dict[str, Any] = orjson.loads(resp_update.content)
 
-            await ctx.report_progress(progress=90, total=100)
+            # в кэш — актуальные метки и исполнители из ответа на PATCH
+            remember_issue(repo, issue_number, updated)
 
-            updated_labels = [l.get("name", "") for l in updated.get("labels", [])]
-            updated_assignees = [
-                a.get("login", "") for a in updated.get("assignees", [])
-            ]
+            updated_labels = list(map(_NAME, updated["labels"]))
+            updated_assignees = list(map(_LOGIN, updated["assignees"]))
 
             lines = [
                 f"Тикет #{issue_number} успешно обновлён.",
@@ -165,10 +188,12 @@ async def update_ticket_meta(
                 lines.append(f"Приоритет: {priority}")
             text = "\n".join(lines)
 
-            await ctx.info("✅ Метаданные тикета обновлены")
-            await ctx.report_progress(progress=100, total=100)
+            await asyncio.gather(
+                log_info(ctx, "✅ Метаданные тикета обновлены"),
+                ctx.report_progress(progress=100, total=100),
+            )
 
-            return ToolResult(
+            return ToolResult.model_construct(
                 content=[TextContent(type="text", text=text)],
                 structured_content={
                     "issue_number": issue_number,
@@ -179,6 +204,9 @@ async def update_ticket_meta(
                 meta={"repo": repo},
             )
 
+        except McpError:
+            # ошибка уже сформирована выше и сообщена клиенту
+            raise
         except httpx.HTTPStatusError as e:
             status = e.response.status_code if e.response else "unknown"
             await ctx.error(f"❌ HTTP ошибка GitHub API: {status}")
@@ -1,10 +1,34 @@
 """Общие утилиты и типы для MCP-инструментов."""
 
-from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+from types import MappingProxyType
+from typing import (
+    Any,
+    Coroutine,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+)
 
+from mcp.server.fastmcp import Context
+from mcp.shared.exceptions import ErrorData, McpError
 from mcp.types import TextContent
+from opentelemetry import trace
 from pydantic import BaseModel
 
+logger = logging.getLogger(__name__)
+
 
 class ToolResult(BaseModel):
     """
@@ -16,6 +40,9 @@ class ToolResult(BaseModel):
         Структурированные данные (для агента / дальнейшей обработки).
     meta:
         Метаданные — что угодно полезное (например, время, параметры).
+
+    Инструменты собирают результат сами, поэтому создают его через
+    ToolResult.model_construct(...) — без валидации pydantic на каждом вызове.
     """
 
     content: List[TextContent]
@@ -29,9 +56,228 @@ def require_env(name: str) -> str:
 
     Поднимает понятную ошибку, если переменная не задана.
     """
-    import os
-
     if value := os.getenv(name):
         return value
     else:
         raise ValueError(f"Обязательная переменная окружения {name} не задана")
+
+
+_NO_HEADERS: Mapping[str, str] = MappingProxyType({})
+
+
+@lru_cache(maxsize=8)
+def github_headers(token: Optional[str]) -> Mapping[str, str]:
+    """
+    Заголовки конкретного запроса к GitHub API — только Authorization
+    (пустые без токена); Accept и версия API заданы на клиенте.
+
+    Результат кэшируется по токену и общий для всех вызовов, поэтому
+    возвращается неизменяемый MappingProxyType.
+    """
+    if not token:
+        return _NO_HEADERS
+    return MappingProxyType({"Authorization": f"Bearer {token}"})
+
+
+class GitHubConfig(NamedTuple):
+    """Настройки GitHub из окружения."""
+
+    repo: str
+    token: Optional[str]
+    headers: Mapping[str, str]
+
+
+@lru_cache(maxsize=1)
+def github_config() -> GitHubConfig:
+    """
+    GITHUB_REPO, GITHUB_TOKEN и заголовки запроса (см. github_headers).
+
+    Окружение читается один раз на процесс; чтобы перечитать его,
+    вызовите github_config.cache_clear(). Ошибка require_env не кэшируется.
+    """
+    token = os.getenv("GITHUB_TOKEN") or None
+    return GitHubConfig(require_env("GITHUB_REPO"), token, github_headers(token))
+
+
+async def checked_github_config(ctx: Context) -> GitHubConfig:
+    """
+    github_config() для инструмента: ошибка окружения сразу становится
+    McpError — до открытия span'а и обращений к GitHub.
+    """
+    try:
+        return github_config()
+    except ValueError as e:
+        await ctx.error(f"❌ Ошибка конфигурации: {e}")
+        raise McpError(
+            ErrorData(
+                code=-32602,
+                message=f"Неверная конфигурация окружения: {e}",
+            )
+        ) from e
+
+
+def trim_comment(text: str, limit: int = 1500) -> str:
+    """
+    Укорачивает текст комментария перед вставкой в промпт.
+
+    После первых 20 строк выкидываются строки длиннее 400 символов
+    (дампы логов, base64 и т.п.), затем текст режется до limit символов
+    с пометкой об обрезке.
+    """
+    if len(text) <= limit:
+        return text
+
+    # идём по строкам, пока не наберём limit символов, — хвост не трогаем
+    kept: List[str] = []
+    size = 0
+    start = 0
+    line_no = 0
+    while size <= limit and start < len(text):
+        end = text.find("\n", start)
+        if end == -1:
+            end = len(text)
+        line = text[start:end]
+        start = end + 1
+        line_no += 1
+        if line_no > 20 and len(line) > 400:
+            continue
+        kept.append(line)
+        size += len(line) + 1
+    text = "\n".join(kept)
+
+    if len(text) > limit:
+        text = text[:limit].rstrip() + "\n…[обрезано]"
+    return text
+
+
+def budget_prompt(system: str, user_fixed: str, variable: str, max_chars: int) -> str:
+    """
+    Собирает промпт `system + variable + user_fixed` не длиннее max_chars.
+
+    У variable отрезается начало (самое старое), чтобы свежие комментарии
+    дошли до модели. Если даже system и user_fixed вместе длиннее max_chars,
+    variable выбрасывается, а у system отрезается конец; user_fixed режется
+    (с начала) только когда сам не влезает. Лимит задаётся в символах:
+    грубо ~3.5 символа на токен, без токенизатора.
+    """
+    if len(user_fixed) >= max_chars:
+        return user_fixed[-max_chars:]
+    room = max_chars - len(system) - len(user_fixed)
+    if room < 0:
+        keep = max_chars - len(user_fixed) - 1
+        system = system[:keep] + "…" if keep > 0 else ""
+        variable = ""
+    elif len(variable) > room:
+        keep = room - 1
+        variable = "…" + variable[-keep:] if keep > 0 else ""
+    return f"{system}{variable}{user_fixed}"
+
+
+# span инструмента, внутри которого идёт текущий вызов (None — вне инструментов)
+_current_tool_span: ContextVar[Optional[trace.Span]] = ContextVar(
+    "_current_tool_span", default=None
+)
+
+
+@contextmanager
+def _started_tool_span(
+    tracer: trace.Tracer, name: str, attributes: Dict[str, Any]
+) -> Iterator[trace.Span]:
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        token = _current_tool_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_tool_span.reset(token)
+
+
+def tool_span(
+    tracer: trace.Tracer,
+    name: str,
+    *,
+    nested_as_event: bool = False,
+    **attributes: Any,
+) -> ContextManager[trace.Span]:
+    """
+    Span инструмента с атрибутами.
+
+    Пока TracerProvider не настроен (Proxy/NoOp по умолчанию), span'ы никуда
+    не уходят — вместо них отдаём заглушку INVALID_SPAN, на которой
+    set_attribute ничего не делает.
+
+    С nested_as_event=True вызов из другого инструмента не открывает свой
+    span, а добавляет событие name в span вызывающего инструмента.
+    """
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, (trace.ProxyTracerProvider, trace.NoOpTracerProvider)):
+        return nullcontext(trace.INVALID_SPAN)
+    if nested_as_event and (parent := _current_tool_span.get()) is not None:
+        parent.add_event(name, attributes=attributes)
+        return nullcontext(trace.INVALID_SPAN)
+    return _started_tool_span(tracer, name, attributes)
+
+
+def wants_progress(ctx: Context) -> bool:
+    """Запросил ли клиент уведомления о прогрессе (передал progressToken)."""
+    try:
+        meta = ctx.request_context.meta
+    except ValueError:  # вызов вне MCP-запроса
+        return False
+    return meta is not None and meta.progressToken is not None
+
+
+# Уровень сообщений инструментов клиенту: MCP_LOG_LEVEL=30 (WARNING) и выше
+# отключает информационные ctx.info, ошибки отправляются всегда
+LOG_LEVEL = int(os.getenv("MCP_LOG_LEVEL", str(logging.INFO)))
+INFO_ENABLED = LOG_LEVEL <= logging.INFO
+
+
+async def log_info(ctx: Context, message: str) -> None:
+    """ctx.info, если информационные сообщения не отключены MCP_LOG_LEVEL."""
+    if INFO_ENABLED:
+        await ctx.info(message)
+
+
+_background: Set["asyncio.Task[Any]"] = set()
+
+
+def fire_and_forget(coro: Coroutine[Any, Any, Any]) -> None:
+    """
+    Запускает корутину фоном, не дожидаясь её, — для ctx.info и прочих
+    уведомлений клиенту, от которых не зависит результат инструмента.
+
+    Ошибки только логируются. Ссылка на задачу держится до её завершения,
+    иначе сборщик мусора может её прервать.
+    """
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_forget)
+
+
+def _forget(task: "asyncio.Task[Any]") -> None:
+    _background.discard(task)
+    if not task.cancelled() and (exc := task.exception()) is not None:
+        logger.debug("Уведомление клиенту не отправлено: %r", exc)
+
+
+# Промежуточный прогресс отправляется, только если инструмент работает
+# дольше этого порога: быстрый вызов (кэш, 304) не шлёт клиенту лишних
+# уведомлений
+PROGRESS_MIN_ELAPSED = 0.05
+
+# MCP_PROGRESS=0 отключает промежуточный прогресс совсем
+PROGRESS_INTERMEDIATE = os.getenv("MCP_PROGRESS", "1") == "1"
+
+
+async def maybe_progress(ctx: Context, progress: float, started: float) -> None:
+    """
+    ctx.report_progress для промежуточного шага.
+
+    started — time.monotonic() на старте инструмента. 0 и 100 отправляются
+    всегда, остальные значения — только после PROGRESS_MIN_ELAPSED секунд
+    и если промежуточный прогресс не выключен через MCP_PROGRESS=0.
+    """
+    if progress in (0, 100) or (
+        PROGRESS_INTERMEDIATE and time.monotonic() - started > PROGRESS_MIN_ELAPSED
+    ):
+        await ctx.report_progress(progress=progress, total=100)